@@ -0,0 +1,4 @@
+"""Shared building blocks for the TÜBİTAK report scripts."""
+
+from betik.cache import EquationCache
+from betik.latex import LaTeXConverter
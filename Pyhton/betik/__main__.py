@@ -0,0 +1,5 @@
+import sys
+
+from betik.batch import main
+
+sys.exit(main())
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+
+from betik.convert import load_report, markdown_flowables, report_flowables
+from betik.fonts import register_times
+from betik.references import ReferenceIndex, build_with_references
+from betik.session import EquationSession
+from betik.streaming import StreamingDocTemplate
+
+# File extensions converted as markdown, everything else is read as a JSON report
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+
+# Stages of the equation pipeline, their time is reported as the equation time of a document
+_EQUATION_STAGES = ('latex', 'dvipng', 'dvisvgm')
+
+# The result of converting one document. timings maps 'total' and
+# 'equations' to seconds, error is the message of a failed conversion.
+DocumentResult = namedtuple('DocumentResult', ['source', 'output', 'pages', 'timings', 'error'])
+
+# What a worker process keeps between the documents it converts
+_worker = {}
+
+def _init_worker(cache_dir, vector, font_dirs):
+  rl_config.TTFSearchPath = list(font_dirs) + list(rl_config.TTFSearchPath)
+  # Parsed fonts go next to the equations, not among them
+  register_times(os.path.join(cache_dir, 'fonts') if cache_dir else None)
+  _worker['session'] = EquationSession(vector=vector, cache_dir=cache_dir)
+
+def convert_document(source, output):
+  """
+  Convert one markdown or JSON report source to PDF in a worker process.
+
+  Args:
+      source (str): The markdown or JSON file
+      output (str): The PDF file to write
+
+  Returns:
+      DocumentResult: The pages and timings of the document
+  """
+  session = _worker['session']
+  start = time.perf_counter()
+  before = _equation_seconds(session)
+  try:
+    doc = StreamingDocTemplate(output, pagesize=A4)
+    # Built again only when a reference to a later label changed
+    index = ReferenceIndex()
+    if source.lower().endswith(MARKDOWN_EXTENSIONS):
+      with open(source, 'r', encoding='utf-8') as f:
+        text = f.read()
+      make_story = lambda: markdown_flowables(text, index)
+      doc.title = os.path.basename(source)
+    else:
+      report = load_report(source)
+      make_story = lambda: report_flowables(report, session=session, index=index)
+      doc.title = report.get('title', os.path.basename(source))
+    build_with_references(doc, make_story, index, canvasmaker=session.canvasmaker)
+  except Exception as e:
+    return DocumentResult(source, output, 0, _timings(session, start, before), f"{type(e).__name__}: {e}")
+  return DocumentResult(source, output, doc.page, _timings(session, start, before), None)
+
+def _equation_seconds(session):
+  timings = session.metrics.snapshot()['timings']
+  return sum(timings[stage]['seconds'] for stage in _EQUATION_STAGES if stage in timings)
+
+def _timings(session, start, before):
+  return {'total': time.perf_counter() - start, 'equations': _equation_seconds(session) - before}
+
+class BatchConverter:
+  """
+  Converts many documents to PDF on a pool of worker processes.
+
+  The workers are started once and kept for every batch given to the
+  converter, so fonts are registered, latex's format is built and the
+  paragraph layout cache fills once per worker rather than once per
+  document. Every worker renders equations into the same on-disk cache, an
+  equation rendered for one document is reused by the others.
+  """
+
+  def __init__(self, workers=None, cache_dir=None, vector=False, font_dirs=()):
+    """
+    Initialize the converter and start its workers.
+
+    Args:
+        workers (int): Number of worker processes, defaults to the number
+            of CPUs
+        cache_dir (str): Folder of the equation cache, defaults to the
+            folder of EquationCache. Parsed fonts are kept in its fonts
+            subfolder, or in the default font cache without one
+        vector (bool): Draw the equations as SVGs
+        font_dirs (list): Folders searched for the TTF files of the
+            Times family before reportlab's search path
+    """
+    self._pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(cache_dir, vector, [os.path.abspath(d) for d in font_dirs]))
+
+  def convert(self, jobs):
+    """
+    Convert documents, yielding their results as they are finished.
+
+    Args:
+        jobs: (source, output) pairs
+
+    Returns:
+        generator: A DocumentResult for every job, in the order they finish
+    """
+    futures = {self._pool.submit(convert_document, source, output): (source, output) for source, output in jobs}
+    for future in as_completed(futures):
+      try:
+        yield future.result()
+      except Exception as e:
+        # The worker itself failed, e.g. it could not register the fonts
+        source, output = futures[future]
+        yield DocumentResult(source, output, 0, {}, f"{type(e).__name__}: {e}")
+
+  def close(self):
+    """Stop the workers."""
+    self._pool.shutdown()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+def find_sources(paths):
+  """
+  Return the documents to convert.
+
+  Args:
+      paths (list): Files, and folders whose markdown and JSON files are taken
+
+  Returns:
+      list: Paths of the source files
+  """
+  sources = []
+  for path in paths:
+    if not os.path.isdir(path):
+      sources.append(path)
+      continue
+    for name in sorted(os.listdir(path)):
+      if name.lower().endswith(MARKDOWN_EXTENSIONS + ('.json',)):
+        sources.append(os.path.join(path, name))
+  return sources
+
+def output_path(source, output_dir=None):
+  """Return the PDF path of a source, next to it or in output_dir."""
+  stem = os.path.splitext(os.path.basename(source))[0]
+  return os.path.join(output_dir or os.path.dirname(source), stem + '.pdf')
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    prog='python -m betik',
+    description='Convert markdown and JSON report sources to PDF on a pool of worker processes.'
+  )
+  parser.add_argument('sources', nargs='+', help='markdown (.md) or JSON report files, or folders of them')
+  parser.add_argument('-o', '--output-dir', help='folder the PDFs are written to, defaults to next to the sources')
+  parser.add_argument('-j', '--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+  parser.add_argument('--cache-dir', help='folder of the equation cache shared by the workers; parsed fonts are kept in '
+                      'its fonts subfolder')
+  parser.add_argument('--font-dir', action='append', default=[], help='folder with the Times TTF files')
+  parser.add_argument('--vector', action='store_true', help='draw equations as vector graphics')
+  parser.add_argument('--json', action='store_true', help='print one JSON object per document')
+  args = parser.parse_args(argv)
+
+  sources = find_sources(args.sources)
+  if args.output_dir:
+    os.makedirs(args.output_dir, exist_ok=True)
+  jobs = [(source, output_path(source, args.output_dir)) for source in sources]
+
+  start = time.perf_counter()
+  pages = failed = 0
+  with BatchConverter(args.workers, args.cache_dir, args.vector, args.font_dir) as converter:
+    for result in converter.convert(jobs):
+      pages += result.pages
+      failed += result.error is not None
+      if args.json:
+        print(json.dumps(result._asdict()), flush=True)
+      elif result.error is not None:
+        print(f"{result.source}: failed: {result.error}", file=sys.stderr, flush=True)
+      else:
+        print(f"{result.source} -> {result.output}: {result.pages} pages in {result.timings['total']:.2f}s "
+              f"(equations {result.timings['equations']:.2f}s)", flush=True)
+
+  if not args.json:
+    print(f"{len(jobs)} documents, {pages} pages in {time.perf_counter() - start:.2f}s"
+          + (f", {failed} failed" if failed else ''), file=sys.stderr)
+  return 1 if failed else 0
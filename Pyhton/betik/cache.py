@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+DEFAULT_CACHE_DIR = os.environ.get(
+  'BETIK_CACHE',
+  os.path.join(os.path.expanduser('~'), '.cache', 'betik')
+)
+
+# Eviction trims the cache to this share of max_bytes, so the folder is
+# scanned again only after a tenth of it has been written
+_LOW_WATER = 0.9
+
+# Temporary files of a put older than this were left by an interrupted one
+_STALE_TEMP_SECONDS = 60 * 60
+
+class EquationCache:
+  """
+  A content-addressed on-disk cache for rendered equations.
+
+  The folder is scanned on the first put and then only when the size of the
+  entries put since, added to what the last scan found, goes over
+  max_bytes. Files put by other processes sharing the folder are counted at
+  the next scan.
+  """
+
+  def __init__(self, directory=None, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 60 * 60, suffix='.png'):
+    """
+    Initialize the cache.
+
+    Args:
+        directory (str): Folder that holds the cached files
+        max_bytes (int): Total size the cache is trimmed down to, None for no limit
+        max_age (float): Seconds an unused entry is kept, None for no limit
+        suffix (str): File extension of the cached files
+    """
+    self.directory = directory or os.path.join(DEFAULT_CACHE_DIR, 'equations')
+    self.max_bytes = max_bytes
+    self.max_age = max_age
+    self.suffix = suffix
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    # Estimated bytes of the entries, None until the folder is scanned
+    self._size = None
+    os.makedirs(self.directory, exist_ok=True)
+
+  @staticmethod
+  def make_key(*parts):
+    """
+    Hash the given parts into a cache key.
+
+    Args:
+        *parts: Values that together identify a rendered file
+
+    Returns:
+        str: Hex digest used as the file name of the entry
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+      digest.update(repr(part).encode('utf-8'))
+      digest.update(b'\0')
+    return digest.hexdigest()
+
+  def path_for(self, key):
+    """Return the path an entry with the given key is stored at."""
+    return os.path.join(self.directory, key + self.suffix)
+
+  def metadata_path_for(self, key):
+    """Return the path of the JSON file holding the metadata of an entry."""
+    return os.path.join(self.directory, key + '.json')
+
+  def get(self, key):
+    """
+    Look up an entry and mark it as recently used.
+
+    Args:
+        key (str): Key created with make_key
+
+    Returns:
+        str: Path of the cached file, or None on a miss
+    """
+    path = self.path_for(key)
+    try:
+      if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+        self._remove(path)
+        raise FileNotFoundError(path)
+      # The modification time doubles as the last access time for the LRU order
+      os.utime(path)
+    except OSError:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return path
+
+  def get_metadata(self, key):
+    """
+    Return the metadata stored with an entry.
+
+    Args:
+        key (str): Key created with make_key
+
+    Returns:
+        dict: The metadata, or None if the entry has none
+    """
+    try:
+      with open(self.metadata_path_for(key), encoding='utf-8') as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return None
+
+  def put(self, key, source_path, metadata=None):
+    """
+    Copy a rendered file into the cache.
+
+    Args:
+        key (str): Key created with make_key
+        source_path (str): File to store under the key
+        metadata (dict): JSON serializable data stored next to the file
+
+    Returns:
+        str: Path of the cached file
+    """
+    path = self.path_for(key)
+    if metadata is not None:
+      # Written before the file itself, so a visible entry always has its metadata
+      fd, temp_path = tempfile.mkstemp(suffix='.json', dir=self.directory)
+      with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+      os.replace(temp_path, self.metadata_path_for(key))
+    fd, temp_path = tempfile.mkstemp(suffix=self.suffix, dir=self.directory)
+    os.close(fd)
+    try:
+      shutil.copyfile(source_path, temp_path)
+      os.replace(temp_path, path)
+    except BaseException:
+      os.remove(temp_path)
+      raise
+    if self._size is not None:
+      self._size += os.path.getsize(path)
+    if self._size is None or (self.max_bytes is not None and self._size > self.max_bytes):
+      self.evict()
+    return path
+
+  def _is_temp(self, name):
+    # Named by tempfile.mkstemp, cache keys are hex digests
+    return name.startswith(tempfile.gettempprefix()) and name.endswith((self.suffix, '.json'))
+
+  def evict(self):
+    """
+    Remove expired entries and temporary files left by interrupted puts.
+
+    When the entries are over the size limit, the least recently used ones
+    are removed until they take up at most nine tenths of it.
+    """
+    now = time.time()
+    entries = []
+    for entry in os.scandir(self.directory):
+      temp = self._is_temp(entry.name)
+      if not temp and not entry.name.endswith(self.suffix):
+        continue
+      try:
+        stat = entry.stat()
+      except OSError:
+        continue
+      if temp:
+        if now - stat.st_mtime > _STALE_TEMP_SECONDS:
+          _remove_file(entry.path)
+      elif self.max_age is not None and now - stat.st_mtime > self.max_age:
+        self._remove(entry.path)
+      else:
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    if self.max_bytes is not None and total > self.max_bytes:
+      entries.sort()
+      for _, size, path in entries:
+        if total <= self.max_bytes * _LOW_WATER:
+          break
+        self._remove(path)
+        total -= size
+    self._size = total
+
+  def _remove(self, path):
+    if _remove_file(path):
+      self.evictions += 1
+    _remove_file(os.path.splitext(path)[0] + '.json')
+
+  def clear(self):
+    """Remove every entry from the cache, and the temporary files of puts."""
+    for entry in os.scandir(self.directory):
+      if self._is_temp(entry.name):
+        _remove_file(entry.path)
+      elif entry.name.endswith(self.suffix):
+        self._remove(entry.path)
+    self._size = 0
+
+  def stats(self):
+    """
+    Return the hit and miss counters of this cache instance.
+
+    Returns:
+        dict: hits, misses, evictions and hit_rate
+    """
+    lookups = self.hits + self.misses
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / lookups if lookups else 0.0,
+    }
+
+def _remove_file(path):
+  try:
+    os.remove(path)
+  except OSError:
+    return False
+  return True
@@ -0,0 +1,290 @@
+import os
+import re
+import json
+from html.parser import HTMLParser
+
+from reportlab.lib import colors
+from reportlab.lib.units import inch, toLength
+from reportlab.platypus import ListFlowable, PageBreak, Spacer, Table, TableStyle
+
+from betik.flowables import EquationLabels, display_flowables
+from betik.images import default_pipeline
+from betik.paragraphs import CachedParagraph
+from betik.references import Label, ReferenceIndex
+from betik.styles import load_styles, report_styles, sample_styles
+
+try:
+  import markdown
+except ImportError:
+  markdown = None
+
+# \label{...} in markdown text names the page of its paragraph
+_LABEL = re.compile(r'\\label\{([^{}]*)\}')
+
+class MarkdownToPDFConverter(HTMLParser):
+  """Convert HTML to ReportLab elements for PDF generation"""
+
+  def __init__(self, index=None):
+    super().__init__()
+    # \ref and \pageref are resolved with it and \label{...}s recorded in it
+    self.index = index if index is not None else ReferenceIndex()
+    # Built once per process and shared by every parse
+    self.styles = sample_styles()
+
+    self.current_style = self.styles['Normal']
+    self.elements = []
+    self.in_list = False
+    self.list_items = []
+    self.list_type = None
+    self.in_table = False
+    self.table_data = []
+    self.current_row = []
+    self.current_cell = []
+    self.text_buffer = ""
+
+  def handle_starttag(self, tag, attrs):
+    # Flush any pending text
+    if self.text_buffer and not (self.in_list or self.in_table):
+      self.elements.extend(self._paragraphs(self.text_buffer, self.current_style))
+      self.text_buffer = ""
+
+    if tag == 'h1':
+      self.current_style = self.styles['Heading1']
+    elif tag == 'h2':
+      self.current_style = self.styles['Heading2']
+    elif tag == 'h3':
+      self.current_style = self.styles['Heading3']
+    elif tag == 'h4':
+      self.current_style = self.styles['Heading4']
+    elif tag == 'h5':
+      self.current_style = self.styles['Heading5']
+    elif tag == 'h6':
+      self.current_style = self.styles['Heading6']
+    elif tag == 'p':
+      self.current_style = self.styles['Normal']
+    elif tag == 'strong' or tag == 'b':
+      self.current_style = self.styles['BodyText']
+    elif tag == 'em' or tag == 'i':
+      self.current_style = self.styles['Italic']
+    elif tag == 'code':
+      self.current_style = self.styles['Code']
+    elif tag == 'pre':
+      self.current_style = self.styles['CodeBlock']
+    elif tag == 'ul':
+      self.in_list = True
+      self.list_type = 'unordered'
+      self.list_items = []
+    elif tag == 'ol':
+      self.in_list = True
+      self.list_type = 'ordered'
+      self.list_items = []
+    elif tag == 'li' and self.in_list:
+      pass  # We'll handle this in handle_data
+    elif tag == 'table':
+      self.in_table = True
+      self.table_data = []
+    elif tag == 'tr' and self.in_table:
+      self.current_row = []
+    elif (tag == 'td' or tag == 'th') and self.in_table:
+      self.current_cell = []
+    elif tag == 'br':
+      self.text_buffer += '<br/>'
+
+  def handle_endtag(self, tag):
+    if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'strong', 'b', 'em', 'i', 'code', 'pre']:
+      # Add the paragraph with the current style
+      if self.text_buffer:
+        self.elements.extend(self._paragraphs(self.text_buffer, self.current_style))
+        self.text_buffer = ""
+      # Add some space after headings and paragraphs
+      if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p']:
+        self.elements.append(Spacer(1, 0.1 * inch))
+      # Reset to normal style
+      self.current_style = self.styles['Normal']
+
+    elif tag == 'ul' or tag == 'ol':
+      # Process the list items
+      bullet_type = 'bullet' if self.list_type == 'unordered' else 'number'
+      for item in self.list_items:
+        # Add bullet or number
+        bullet_text = '• ' if bullet_type == 'bullet' else f"{self.list_items.index(item) + 1}. "
+        self.elements.extend(self._paragraphs(f"{bullet_text}{item}", self.styles['Normal']))
+
+      self.in_list = False
+      self.list_items = []
+      self.list_type = None
+      self.elements.append(Spacer(1, 0.1 * inch))
+
+    elif tag == 'li' and self.in_list:
+      if self.text_buffer:
+        self.list_items.append(self.text_buffer)
+        self.text_buffer = ""
+
+    elif tag == 'table':
+      # Process the table
+      if self.table_data:
+        # Create a ReportLab Table
+        table_style = TableStyle([
+          ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+          ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+          ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+          ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+          ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+          ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+          ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ])
+
+        table = Table(self.table_data)
+        table.setStyle(table_style)
+        self.elements.append(table)
+        self.elements.append(Spacer(1, 0.2 * inch))
+
+      self.in_table = False
+      self.table_data = []
+
+    elif tag == 'tr' and self.in_table:
+      if self.current_row:
+        self.table_data.append(self.current_row)
+
+    elif (tag == 'td' or tag == 'th') and self.in_table:
+      if self.text_buffer:
+        cell = self._paragraphs(self.text_buffer, self.styles['Normal'])
+        self.current_row.append(cell if len(cell) > 1 else cell[0])
+        self.text_buffer = ""
+
+  def handle_data(self, data):
+    self.text_buffer += data
+
+  def _paragraphs(self, text, style):
+    # The paragraph, followed by the Labels its \label{...}s name
+    names = _LABEL.findall(text)
+    paragraph = CachedParagraph(self.index.resolve(_LABEL.sub('', text)), style)
+    return [paragraph] + [Label(name, self.index) for name in names]
+
+  def get_elements(self):
+    # Flush any remaining text
+    if self.text_buffer:
+      self.elements.extend(self._paragraphs(self.text_buffer, self.current_style))
+
+    return self.elements
+
+  def iter_elements(self, html, chunk_size=8192):
+    """
+    Parse the HTML piece by piece, yielding elements as they are completed.
+
+    Unlike feed() and get_elements(), only the elements of the current
+    piece are held at a time, so a StreamingDocTemplate can lay out a
+    long document while it is still being parsed.
+
+    Args:
+        html (str): The HTML to convert
+        chunk_size (int): Number of characters parsed at a time
+    """
+    for start in range(0, len(html), chunk_size):
+      self.feed(html[start:start + chunk_size])
+      elements, self.elements = self.elements, []
+      yield from elements
+    self.close()
+    elements, self.elements = self.get_elements(), []
+    yield from elements
+
+def markdown_flowables(text, index=None):
+  """
+  Convert markdown to flowables the way the markdown editor does.
+
+  \\label{name} in a paragraph names the page it is on, and \\pageref{name}
+  and \\ref{name} are resolved with the index; build with
+  build_with_references to have them right. Needs the markdown package.
+
+  Args:
+      text (str): The markdown source
+      index (ReferenceIndex): Index of the document's labels
+
+  Returns:
+      generator: The flowables, created as layout reaches them
+  """
+  if markdown is None:
+    raise RuntimeError("Converting markdown needs the markdown package, install it with pip install markdown.")
+  html = markdown.markdown(text, extensions=['tables', 'fenced_code'])
+  return MarkdownToPDFConverter(index).iter_elements(html)
+
+def load_report(path):
+  """
+  Read a JSON report source.
+
+  A report is an object with a "content" list and optionally a "title"
+  and a "styles" file for load_styles, relative to the report. Items of
+  the content are
+
+      "text"                                 a Paragraf with LaTeX math
+      {"text": "...", "style": "Baslik"}     a paragraph of another style
+      {"spacer": "0.125in"}                  vertical space
+      {"image": "img1.png", "width": "3in"}   resampled by betik.images
+      {"list": ["...", "..."], "style": "Madde"}
+      {"page_break": true}
+
+  Args:
+      path (str): The JSON file
+
+  Returns:
+      dict: The report, with the paths of the styles and images resolved
+  """
+  with open(path, 'r', encoding='utf-8') as f:
+    report = json.load(f)
+  if not isinstance(report, dict) or not isinstance(report.get('content'), list):
+    raise ValueError(f"{path}: expected an object with a \"content\" list")
+  # Files are named relative to the report
+  folder = os.path.dirname(os.path.abspath(path))
+  if report.get('styles'):
+    report['styles'] = os.path.join(folder, report['styles'])
+  for item in report['content']:
+    if isinstance(item, dict) and 'image' in item:
+      item['image'] = os.path.join(folder, item['image'])
+  return report
+
+def report_flowables(report, base=None, session=None, vector=False, index=None):
+  """
+  Convert a report read by load_report to flowables.
+
+  Labelled display equations are numbered and recorded in the index, and
+  \\ref, \\eqref and \\pageref in the text are resolved with it; build with
+  build_with_references to have references to later equations right.
+
+  Args:
+      report (dict): The report
+      base (StyleSheet): Styles the report's styles file changes, defaults
+          to report_styles()
+      session (EquationSession): Renders the equations, defaults to the
+          shared session
+      vector (bool): Use the shared vector session when none is given
+      index (ReferenceIndex): Index of the document's labels
+
+  Returns:
+      generator: The flowables, created and their equations rendered as
+                 layout reaches them
+  """
+  styles = base if base is not None else report_styles()
+  labels = EquationLabels(index)
+  if report.get('styles'):
+    styles = load_styles(report['styles'], styles)
+
+  for n, item in enumerate(report['content'], 1):
+    if isinstance(item, str):
+      item = {'text': item}
+    if 'text' in item:
+      yield from display_flowables(item['text'], styles[item.get('style', 'Paragraf')], session, vector, labels)
+    elif 'spacer' in item:
+      yield Spacer(1, _length(item['spacer']))
+    elif 'image' in item:
+      yield default_pipeline().image(item['image'], _length(item.get('width')), _length(item.get('height')))
+    elif 'list' in item:
+      paragraph = styles[item.get('item_style', 'Paragraf')]
+      yield ListFlowable([CachedParagraph(labels.resolve(text), paragraph) for text in item['list']],
+                         style=styles[item.get('style', 'Madde')])
+    elif item.get('page_break'):
+      yield PageBreak()
+    else:
+      raise ValueError(f"content item {n}: unknown item {item!r}")
+
+def _length(value):
+  return toLength(value) if isinstance(value, str) else value
@@ -0,0 +1,196 @@
+import re
+from itertools import groupby
+from xml.sax.saxutils import escape
+
+# Fonts the simple equations are drawn with. They are standard PDF fonts, so
+# they are always available and need no registration.
+ROMAN_FONT = 'Times-Roman'
+ITALIC_FONT = 'Times-Italic'
+SYMBOL_FONT = 'Symbol'
+
+GREEK = {
+  'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'delta': 'δ', 'epsilon': 'ε',
+  'varepsilon': 'ε', 'zeta': 'ζ', 'eta': 'η', 'theta': 'θ', 'vartheta': 'ϑ',
+  'iota': 'ι', 'kappa': 'κ', 'lambda': 'λ', 'mu': 'μ', 'nu': 'ν', 'xi': 'ξ',
+  'pi': 'π', 'varpi': 'ϖ', 'rho': 'ρ', 'sigma': 'σ', 'varsigma': 'ς',
+  'tau': 'τ', 'upsilon': 'υ', 'phi': 'ϕ', 'varphi': 'φ', 'chi': 'χ',
+  'psi': 'ψ', 'omega': 'ω',
+  'Gamma': 'Γ', 'Delta': 'Δ', 'Theta': 'Θ', 'Lambda': 'Λ', 'Xi': 'Ξ',
+  'Pi': 'Π', 'Sigma': 'Σ', 'Upsilon': 'ϒ', 'Phi': 'Φ', 'Psi': 'Ψ',
+  'Omega': 'Ω',
+}
+
+OPERATORS = {
+  'pm': '±', 'times': '×', 'cdot': '⋅', 'div': '÷', 'leq': '≤', 'le': '≤',
+  'geq': '≥', 'ge': '≥', 'neq': '≠', 'ne': '≠', 'approx': '≈', 'equiv': '≡',
+  'sim': '∼', 'propto': '∝', 'infty': '∞', 'to': '→', 'rightarrow': '→',
+  'leftarrow': '←', 'Rightarrow': '⇒', 'Leftrightarrow': '⇔', 'partial': '∂',
+  'nabla': '∇', 'in': '∈', 'notin': '∉', 'subset': '⊂', 'cup': '∪',
+  'cap': '∩', 'forall': '∀', 'exists': '∃', 'ldots': '…', 'dots': '…',
+  'prime': '′',
+}
+
+# Spacing commands and the (no-break) spaces they are replaced with, as
+# the standard fonts have no thin or em spaces
+SPACES = {',': '\u00a0', ':': '\u00a0', ';': '\u00a0', ' ': '\u00a0', 'quad': '\u00a0' * 4, '!': ''}
+
+# Characters set upright in the roman font, everything else that is not a
+# letter falls back to TeX
+_ROMAN = set('0123456789.,;:!?()[]|/+=<>')
+# Characters that have a better glyph in the symbol font
+_SYMBOL_CHARS = {'-': '−', "'": '′', '*': '∗'}
+
+# Relations and binary operators, which TeX surrounds with space. A binary
+# operator at the start of a group or after another operator is a sign.
+_RELATIONS = set('=<>≤≥≠≈≡∼∝→←⇒⇔∈∉⊂')
+_BINARY = set('+−±×⋅÷∪∩')
+# No-break space, so that a line is never broken inside an equation
+_SPACE = '\u00a0'
+
+_TOKEN = re.compile(r'\\[A-Za-z]+|\\.|\s+|.', re.DOTALL)
+
+class _Unsupported(Exception):
+  """Raised when an equation uses something outside the simple subset."""
+
+def render_simple(equation):
+  """
+  Lay out a simple equation as paragraph markup, without running TeX.
+
+  Sub- and superscripts, Greek letters, common operators and fractions of
+  plain numbers or letters are supported. Letters are set in italics,
+  numbers and operators upright, as TeX does.
+
+  Args:
+      equation (str): The LaTeX equation, without delimiters
+
+  Returns:
+      str: Paragraph markup drawing the equation, or None if the equation
+           needs TeX
+  """
+  tokens = [token for token in _TOKEN.findall(equation) if not token.isspace()]
+  try:
+    runs, position = _parse(tokens, 0, in_script=False)
+  except _Unsupported:
+    return None
+  if position != len(tokens):
+    return None
+  return _to_markup(runs) or None
+
+def _parse(tokens, position, in_script, closing=None):
+  """
+  Parse tokens up to closing (or the end) into (tag, font, text) runs.
+
+  Returns:
+      tuple: (runs, position after the last consumed token)
+  """
+  runs = []
+  # Set after a script or fraction, which can not take another script
+  # without stacking the two (x_i^2)
+  scripted = False
+  while position < len(tokens):
+    token = tokens[position]
+    if token == closing:
+      return runs, position
+    if token == '}':
+      raise _Unsupported(token)
+
+    if token in ('_', '^'):
+      if in_script or scripted or not runs:
+        raise _Unsupported(token)
+      script, position = _parse_argument(tokens, position + 1, in_script=True)
+      tag = 'sub' if token == '_' else 'super'
+      runs.extend((tag, font, text) for _, font, text in script)
+      scripted = True
+      continue
+
+    if token == '\\frac':
+      if in_script:
+        raise _Unsupported(token)
+      numerator, position = _parse_argument(tokens, position + 1, in_script=True)
+      denominator, position = _parse_argument(tokens, position, in_script=True)
+      if not (_is_plain(numerator) and _is_plain(denominator)):
+        # (a+b)/c would need parentheses to read right, leave those to TeX
+        raise _Unsupported(token)
+      # Inline fractions are set with a fraction slash, like 1/2 in text
+      runs.extend(('super', font, text) for _, font, text in numerator)
+      runs.append((None, SYMBOL_FONT, '⁄'))
+      runs.extend(('sub', font, text) for _, font, text in denominator)
+      scripted = True
+      continue
+
+    atom, position = _parse_atom(tokens, position, in_script)
+    if not in_script and len(atom) == 1 and _is_spaced(atom[0][2], runs):
+      # The symbol font has no space, so the spaces are set in the roman one
+      atom = [(None, ROMAN_FONT, _SPACE), atom[0], (None, ROMAN_FONT, _SPACE)]
+    runs.extend(atom)
+    scripted = False
+  if closing is not None:
+    raise _Unsupported('missing ' + closing)
+  return runs, position
+
+def _is_spaced(text, runs):
+  """Return True if an atom is a relation or a binary operator following an operand."""
+  if text in _RELATIONS:
+    return True
+  if text not in _BINARY or not runs:
+    return False
+  previous = runs[-1][2][-1]
+  return previous not in '([' and previous != _SPACE
+
+def _is_plain(runs):
+  """Return True if runs are only letters and numbers."""
+  text = ''.join(text for _, _, text in runs)
+  return bool(text) and all(char.isalnum() or char == '.' for char in text)
+
+def _parse_argument(tokens, position, in_script):
+  """Parse a single token or a {group} argument."""
+  if position >= len(tokens):
+    raise _Unsupported('missing argument')
+  if tokens[position] == '{':
+    runs, position = _parse(tokens, position + 1, in_script, closing='}')
+    return runs, position + 1
+  if tokens[position] in ('_', '^', '}'):
+    raise _Unsupported(tokens[position])
+  return _parse_atom(tokens, position, in_script)
+
+def _parse_atom(tokens, position, in_script):
+  """Parse one letter, number, symbol, command or group."""
+  token = tokens[position]
+  if token == '{':
+    runs, position = _parse(tokens, position + 1, in_script, closing='}')
+    return runs, position + 1
+
+  if token.startswith('\\'):
+    name = token[1:]
+    if name in GREEK:
+      return [(None, SYMBOL_FONT, GREEK[name])], position + 1
+    if name in OPERATORS:
+      return [(None, SYMBOL_FONT, OPERATORS[name])], position + 1
+    if name in SPACES:
+      return [(None, ROMAN_FONT, SPACES[name])], position + 1
+    if name in ('{', '}', '%', '&', '#', '$'):
+      return [(None, ROMAN_FONT, name)], position + 1
+    raise _Unsupported(token)
+
+  if token.isascii() and token.isalpha():
+    return [(None, ITALIC_FONT, token)], position + 1
+  if token in _ROMAN:
+    return [(None, ROMAN_FONT, token)], position + 1
+  if token in _SYMBOL_CHARS:
+    return [(None, SYMBOL_FONT, _SYMBOL_CHARS[token])], position + 1
+  raise _Unsupported(token)
+
+def _to_markup(runs):
+  """Join runs into markup, merging neighbours that share tag and font."""
+  parts = []
+  runs = [run for run in runs if run[2]]
+  for tag, tag_runs in groupby(runs, key=lambda run: run[0]):
+    fonts = []
+    for font, font_runs in groupby(tag_runs, key=lambda run: run[1]):
+      text = ''.join(text for _, _, text in font_runs)
+      fonts.append('<font name="%s">%s</font>' % (font, escape(text)))
+    markup = ''.join(fonts)
+    if tag is not None:
+      markup = '<%s>%s</%s>' % (tag, markup, tag)
+    parts.append(markup)
+  return ''.join(parts)
@@ -0,0 +1,226 @@
+import re
+
+from reportlab.lib.sequencer import getSequencer
+from reportlab.platypus.flowables import Flowable
+
+from betik.markup import DISPLAY_MATH, render_latex, tokenize
+from betik.paragraphs import CachedParagraph
+from betik.references import ReferenceIndex
+from betik.session import default_session
+
+# \label{...} inside a display equation names it and turns numbering on
+_LABEL = re.compile(r'\\label\{([^{}]*)\}')
+
+class EquationLabels:
+  """
+  The numbers of the labelled equations of one document.
+
+  Create one per build and pass it to display_flowables or the
+  DisplayEquations, so references only see the equations of their own
+  document, whatever else the process builds. The numbers and pages of the
+  equations are recorded in a ReferenceIndex, from which references to
+  equations further on are resolved; build the document with
+  build_with_references to have those right.
+  """
+
+  def __init__(self, index=None):
+    """
+    Initialize the labels.
+
+    Args:
+        index (ReferenceIndex): Index of the document, defaults to one of
+            its own, with which references to later equations stay (??)
+    """
+    # Label -> formatted number of the numbered equations created so far
+    self.numbers = {}
+    self.index = index if index is not None else ReferenceIndex()
+
+  def define(self, label, number):
+    """Record the number of a labelled equation."""
+    self.numbers[label] = number
+    self.index.define(label, number)
+
+  def place(self, label, page):
+    """Record the page a labelled equation is drawn on."""
+    self.index.place(label, page)
+
+  def ref(self, label):
+    """
+    Return paragraph markup referring to a labelled equation, like \\eqref.
+
+    Args:
+        label (str): Label given to the DisplayEquation
+
+    Returns:
+        str: The number in parentheses, linked to the equation, or (??) when
+             neither this build nor the previous one has the label
+    """
+    return self.resolve('\\eqref{%s}' % label)
+
+  def resolve(self, text):
+    """
+    Replace \\ref, \\eqref and \\pageref in paragraph markup, see ReferenceIndex.resolve.
+
+    Equations created already in this build give their own numbers, the
+    others those of the previous build.
+    """
+    return self.index.resolve(text, self.numbers)
+
+class DisplayEquation(Flowable):
+  """
+  An equation set on a line of its own, centered, with an optional number.
+
+  Numbers come from the same reportlab sequencer as <seq id="equation"/>
+  in paragraphs, so the two can be mixed and reset with <seqreset/>. The
+  equation is rendered once, the first time it is laid out (or up front by
+  display_flowables), and reused by every later wrap and draw.
+  """
+
+  def __init__(self, equation, label=None, numbered=None, session=None, rendered=None,
+               fontName='Times-Roman', fontSize=12, spaceBefore=6, spaceAfter=6, counter='equation', labels=None):
+    """
+    Initialize the equation.
+
+    Args:
+        equation (str): The LaTeX equation, without delimiters
+        label (str): Name to refer to the equation with EquationLabels.ref and
+            <a href="#label">
+        numbered (bool): Show an equation number, defaults to whether a
+            label is given
+        session (EquationSession): Renders the equation, defaults to the
+            shared one
+        rendered (RenderedEquation): The equation rendered already
+        fontName (str): Font of the number
+        fontSize (float): Size of the number
+        spaceBefore (float): Space above the equation
+        spaceAfter (float): Space below the equation
+        counter (str): Sequencer counter the numbers are taken from
+        labels (EquationLabels): Where the number and page of a labelled
+            equation are recorded for references
+    """
+    super().__init__()
+    self.equation = equation
+    self.label = label
+    self.session = session or default_session()
+    self.rendered = rendered
+    self.fontName = fontName
+    self.fontSize = fontSize
+    self.spaceBefore = spaceBefore
+    self.spaceAfter = spaceAfter
+    self.labels = labels
+
+    if numbered is None:
+      numbered = label is not None
+    self.number = getSequencer().nextf(counter) if numbered else None
+    if labels is not None and label is not None and self.number is not None:
+      labels.define(label, self.number)
+
+  def fingerprint(self):
+    """Return what the layout of the equation depends on, see betik.incremental."""
+    return (self.equation, self.label, self.number, self.session, self.fontName, self.fontSize,
+            self.spaceBefore, self.spaceAfter)
+
+  def _render(self):
+    if self.rendered is None:
+      self.rendered = self.session.render_equations([self.equation])[0]
+    return self.rendered
+
+  def _size(self):
+    """Return (width, height, depth) of the equation as drawn."""
+    rendered = self._render()
+    if not rendered:
+      # The source is shown instead, one line of Courier
+      return len(self.equation) * self.fontSize * 0.6, self.fontSize, self.fontSize * 0.2
+    scale = self.session.scale
+    size = rendered.metrics
+    return size.width * scale, size.height * scale, size.depth * scale
+
+  def wrap(self, availWidth, availHeight):
+    _, height, depth = self._size()
+    self.width = availWidth
+    self.height = max(height + depth, self.fontSize * 1.2)
+    return self.width, self.height
+
+  def draw(self):
+    width, height, depth = self._size()
+    canvas = self.canv
+    # The baseline of the equation, with the box centered vertically
+    baseline = (self.height - height - depth) / 2 + depth
+
+    if self.label is not None:
+      # Destinations are given in page coordinates, not the flowable's
+      _, top = canvas.absolutePosition(0, self.height)
+      canvas.bookmarkPage(self.label, fit='XYZ', top=top)
+      if self.labels is not None:
+        self.labels.place(self.label, canvas.getPageNumber())
+
+    rendered = self._render()
+    if rendered:
+      canvas.drawImage(rendered.path, (self.width - width) / 2, baseline - depth, width, height + depth, mask='auto')
+    else:
+      canvas.saveState()
+      canvas.setFont('Courier', self.fontSize)
+      canvas.setFillColor('red')
+      canvas.drawCentredString(self.width / 2, baseline, self.equation)
+      canvas.restoreState()
+
+    if self.number is not None:
+      canvas.setFont(self.fontName, self.fontSize)
+      canvas.drawRightString(self.width, baseline, '(%s)' % self.number)
+
+def display_flowables(text, style, session=None, vector=False, labels=None):
+  """
+  Split a paragraph at its display math into paragraphs and DisplayEquations.
+
+  Display math with a \\label{...} is numbered and can be referred to, and
+  \\ref, \\eqref and \\pageref in the text are resolved with labels.
+  Every display equation of the text is rendered in one batch.
+
+  Args:
+      text (str): Paragraph markup with embedded LaTeX
+      style (ParagraphStyle): Style of the paragraphs around the equations
+      session (EquationSession): Renders the equations, defaults to the
+          shared session
+      vector (bool): Use the shared vector session when none is given
+      labels (EquationLabels): Labels of the document the equations
+          are numbered in
+
+  Returns:
+      list: Paragraph and DisplayEquation flowables in text order
+  """
+  if session is None:
+    session = default_session(vector)
+
+  displays = [segment for segment in tokenize(text) if segment.kind == DISPLAY_MATH]
+  equations = [_LABEL.sub('', segment.text).strip() for segment in displays]
+  rendered = session.render_equations(equations)
+
+  # Text that continues a paragraph after an equation is not indented again
+  continued = style.clone(style.name + '-continued', firstLineIndent=0)
+  flowables = []
+  position = 0
+  for segment, equation, image in zip(displays, equations, rendered):
+    before = text[position:segment.start].strip()
+    if before:
+      flowables.append(CachedParagraph(_resolve(render_latex(before, session=session), labels),
+                                       continued if position else style))
+    label = _LABEL.search(segment.text)
+    flowables.append(DisplayEquation(
+      equation,
+      label=label and label.group(1),
+      session=session,
+      rendered=image,
+      fontName=style.fontName,
+      fontSize=style.fontSize,
+      labels=labels
+    ))
+    position = segment.end
+  after = text[position:].strip()
+  if after:
+    flowables.append(CachedParagraph(_resolve(render_latex(after, session=session), labels),
+                                     continued if position else style))
+  return flowables
+
+def _resolve(markup, labels):
+  # After render_latex, so references inside math are left to LaTeX
+  return labels.resolve(markup) if labels is not None else markup
@@ -0,0 +1,131 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from fnmatch import fnmatch
+from functools import partial
+from operator import mul
+from weakref import WeakKeyDictionary
+
+import reportlab
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfbase.pdfmetrics import registerFontFamily
+from reportlab.pdfbase.ttfonts import TTEncoding, TTFont, TTFontFace, TTFOpenFile
+
+from betik.cache import DEFAULT_CACHE_DIR
+
+# Bump whenever the layout of the cached font files changes
+FONT_CACHE_VERSION = 1
+
+# Font name and file of every style of the Times family used by the reports
+TIMES_FAMILY = {
+  'normal': ('Times', 'times.ttf'),
+  'bold': ('TimesBd', 'timesbd.ttf'),
+  'italic': ('TimesIt', 'timesi.ttf'),
+  'boldItalic': ('TimesBI', 'timesbi.ttf'),
+}
+
+_registered_families = set()
+_register_lock = threading.Lock()
+
+def register_family(family, fonts, cache_dir=None):
+  """
+  Register a TrueType font family once per process.
+
+  Later calls with the same family name return right away, so every
+  script and builder can call this without paying for it twice.
+
+  Args:
+      family (str): Name of the family, used with <b> and <i> in paragraphs
+      fonts (dict): 'normal', 'bold', 'italic' and 'boldItalic' mapped to
+          (font name, TTF file name) pairs
+      cache_dir (str): Folder the parsed fonts are kept in
+  """
+  with _register_lock:
+    if family in _registered_families:
+      return
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, filename in fonts.values():
+      if name not in registered:
+        pdfmetrics.registerFont(load_ttf(name, filename, cache_dir))
+    registerFontFamily(family, **{style: name for style, (name, _) in fonts.items()})
+    _registered_families.add(family)
+
+def register_times(cache_dir=None):
+  """Register the Times family (Times, TimesBd, TimesIt, TimesBI) once per process."""
+  register_family('Times', TIMES_FAMILY, cache_dir)
+
+def load_ttf(name, filename, cache_dir=None):
+  """
+  Create a TTFont, reusing the tables parsed by an earlier run.
+
+  Parsing the tables and glyph widths of a TTF file is most of the cost of
+  loading it. They are pickled next to the equation cache the first time a
+  file is loaded and read back on later runs, as long as the file and the
+  reportlab version stay the same. The font file itself is still read, as
+  reportlab subsets it when the PDF is written.
+
+  Args:
+      name (str): Name the font is registered under
+      filename (str): TTF file, looked up like reportlab does
+      cache_dir (str): Folder the parsed fonts are kept in
+
+  Returns:
+      TTFont: The font, ready for pdfmetrics.registerFont
+  """
+  path, f = TTFOpenFile(filename)
+  f.close()
+  try:
+    stat = os.stat(path)
+  except (OSError, TypeError):
+    # Not a plain file, e.g. loaded from a zip
+    return TTFont(name, filename)
+
+  digest = hashlib.sha256(repr((
+    os.path.abspath(path), stat.st_size, stat.st_mtime_ns, reportlab.Version, FONT_CACHE_VERSION
+  )).encode('utf-8')).hexdigest()
+  cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'fonts')
+  cache_path = os.path.join(cache_dir, digest + '.pickle')
+
+  try:
+    with open(cache_path, 'rb') as f:
+      state = pickle.load(f)
+    return _font_from_state(name, path, state)
+  except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, ValueError):
+    pass
+
+  font = TTFont(name, filename)
+  state = {key: value for key, value in vars(font.face).items() if key not in ('_ttf_data', '_pdfScale')}
+  try:
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix='.pickle', dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
+  except OSError:
+    # A read-only cache only costs the parsing time
+    pass
+  return font
+
+def _font_from_state(name, path, state):
+  """Rebuild a TTFont from pickled face attributes, the way TTFont.__init__ would."""
+  face = TTFontFace.__new__(TTFontFace)
+  vars(face).update(state)
+  with open(path, 'rb') as f:
+    face._ttf_data = f.read()
+  # extractInfo stores this as a lambda, which can not be pickled
+  face._pdfScale = _identity if face.unitsPerEm == 1000 else partial(mul, 1000 / face.unitsPerEm)
+
+  font = TTFont.__new__(TTFont)
+  font.fontName = name
+  font.face = face
+  font.encoding = TTEncoding()
+  font.state = WeakKeyDictionary()
+  font._asciiReadable = rl_config.ttfAsciiReadable
+  font.shapable = not any(fnmatch(name, pattern) for pattern in ttfonts.unShapedFontGlob)
+  return font
+
+def _identity(value):
+  return value
@@ -0,0 +1,189 @@
+import os
+import hashlib
+import tempfile
+import threading
+
+from PIL import Image as PILImage
+from reportlab.platypus import Image
+
+from betik.cache import DEFAULT_CACHE_DIR, EquationCache
+
+# Bump whenever the way images are resampled or encoded changes
+IMAGE_PIPELINE_VERSION = 2
+
+# Distinct colors of the thumbnail above which an image is taken for a photo
+PHOTO_COLORS = 4096
+
+# The same for grayscale images, which have at most 256 levels
+PHOTO_GRAYS = 32
+
+class ImagePipeline:
+  """
+  Resamples the images of a document to the resolution they are printed at.
+
+  A 12 megapixel photo drawn 8 cm wide needs about a tenth of its pixels at
+  200 DPI. Every image is scaled down to the output DPI at the size it is
+  drawn, then stored as JPEG when it looks like a photo and as PNG when it
+  has transparency or few colors, like diagrams and screenshots. Results
+  are kept in an on-disk cache by the hash of the source, the pixel size
+  and the JPEG quality, so later builds only hash the source file.
+
+  Images that already have no more pixels than needed are used as they
+  are, nothing is ever scaled up.
+  """
+
+  def __init__(self, dpi=200, quality=85, cache_dir=None, max_bytes=256 * 1024 * 1024):
+    """
+    Initialize the pipeline.
+
+    Args:
+        dpi (int): Resolution of the images on the page
+        quality (int): JPEG quality of the photos, 1 to 95
+        cache_dir (str): Folder of the resampled images, defaults to the
+            images folder next to the equation cache
+        max_bytes (int): Size the cached images are trimmed down to, split
+            evenly between the JPEG and PNG folders
+    """
+    self.dpi = dpi
+    self.quality = quality
+    directory = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'images')
+    # One folder per format, so each cache only evicts its own files
+    share = max_bytes // 2 if max_bytes is not None else None
+    self._caches = {
+      'JPEG': EquationCache(os.path.join(directory, 'jpeg'), max_bytes=share, suffix='.jpg'),
+      'PNG': EquationCache(os.path.join(directory, 'png'), max_bytes=share, suffix='.png'),
+    }
+    # (path, mtime, size) -> hash of the file, so unchanged sources are read once
+    self._hashes = {}
+    self._lock = threading.Lock()
+
+  def _source_hash(self, path):
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with self._lock:
+      digest = self._hashes.get(stamp)
+    if digest is None:
+      digest = hashlib.sha256()
+      with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+          digest.update(block)
+      digest = digest.hexdigest()
+      with self._lock:
+        self._hashes[stamp] = digest
+    return digest
+
+  def pixel_size(self, width, height):
+    """Return the pixel size an image drawn width x height points needs."""
+    return max(1, round(width / 72 * self.dpi)), max(1, round(height / 72 * self.dpi))
+
+  def prepare(self, path, width, height):
+    """
+    Return a file with the pixels an image needs when drawn at a size.
+
+    Args:
+        path (str): The source image
+        width (float): Drawn width in points
+        height (float): Drawn height in points
+
+    Returns:
+        str: Path of the resampled image in the cache, or path itself when
+             it has no more pixels than needed
+    """
+    target = self.pixel_size(width, height)
+    with PILImage.open(path) as image:
+      if image.width <= target[0] and image.height <= target[1] and image.format in self._caches:
+        return path
+
+    key = EquationCache.make_key(IMAGE_PIPELINE_VERSION, self._source_hash(path), target, self.quality)
+    for cache in self._caches.values():
+      cached = cache.get(key)
+      if cached is not None:
+        return cached
+
+    with PILImage.open(path) as image:
+      # JPEG sources are decoded at a reduced scale when they are much larger
+      image.draft('RGB', target)
+      image.load()
+      resampled = self._resample(image, target)
+    kind = 'PNG' if _keeps_png(resampled) else 'JPEG'
+    cache = self._caches[kind]
+    fd, temp_path = tempfile.mkstemp(suffix=cache.suffix, dir=cache.directory)
+    os.close(fd)
+    try:
+      if kind == 'JPEG':
+        resampled.convert('L' if resampled.mode == 'L' else 'RGB').save(
+          temp_path, 'JPEG', quality=self.quality, optimize=True
+        )
+      else:
+        resampled.save(temp_path, 'PNG', optimize=True)
+      return cache.put(key, temp_path)
+    finally:
+      os.remove(temp_path)
+
+  def _resample(self, image, target):
+    if image.mode == '1':
+      image = image.convert('L')
+    elif image.mode not in ('L', 'LA', 'P', 'RGB', 'RGBA'):
+      image = image.convert('RGB')
+    elif image.mode == 'P':
+      image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image.width <= target[0] and image.height <= target[1]:
+      return image
+    return image.resize(target, PILImage.Resampling.LANCZOS)
+
+  def image(self, path, width=None, height=None, **kw):
+    """
+    Create a reportlab Image of a source, drawn at the given size.
+
+    Args:
+        path (str): The source image
+        width (float): Drawn width in points
+        height (float): Drawn height in points. Without one of the two the
+            aspect ratio of the source is kept, without both the image is
+            drawn one point per pixel like reportlab does
+        **kw: Other Image arguments
+
+    Returns:
+        Image: The flowable, reading the resampled file
+    """
+    if width is None or height is None:
+      with PILImage.open(path) as source:
+        source_width, source_height = source.size
+      if width is None and height is None:
+        width, height = source_width, source_height
+      elif width is None:
+        width = height * source_width / source_height
+      else:
+        height = width * source_height / source_width
+    return Image(self.prepare(path, width, height), width=width, height=height, **kw)
+
+def _keeps_png(image):
+  """Whether an image has transparency or so few colors that PNG suits it better than JPEG."""
+  if image.mode in ('LA', 'RGBA') and image.getchannel('A').getextrema()[0] < 255:
+    return True
+  thumbnail = image.copy()
+  # Nearest neighbour adds no colors of its own to the count
+  thumbnail.thumbnail((256, 256), PILImage.Resampling.NEAREST)
+  colors = thumbnail.convert('RGB').getcolors(PHOTO_COLORS)
+  if colors is None:
+    return False
+  if all(r == g == b for _, (r, g, b) in colors):
+    # Grayscale, where even a photo has few enough levels for the color count
+    return len(colors) <= PHOTO_GRAYS
+  return True
+
+_default_pipelines = {}
+_default_pipelines_lock = threading.Lock()
+
+def default_pipeline(dpi=200, quality=85):
+  """
+  Return the image pipeline shared by every caller of this process.
+
+  Returns:
+      ImagePipeline: The same object on every call with the same settings
+  """
+  with _default_pipelines_lock:
+    pipeline = _default_pipelines.get((dpi, quality))
+    if pipeline is None:
+      pipeline = _default_pipelines[(dpi, quality)] = ImagePipeline(dpi, quality)
+    return pipeline
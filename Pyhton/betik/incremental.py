@@ -0,0 +1,345 @@
+import os
+from copy import deepcopy
+
+from reportlab.lib.colors import Color
+from reportlab.lib.styles import ListStyle
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import PageTemplate, Paragraph, SimpleDocTemplate, Table
+from reportlab.platypus.doctemplate import ActionFlowable, BaseDocTemplate, NextPageTemplate, _doNothing
+from reportlab.platypus.flowables import (
+  CondPageBreak, Flowable, Image, KeepInFrame, KeepTogether, ListFlowable, ListItem, PageBreak, Spacer
+)
+from reportlab.platypus.frames import Frame
+
+from betik.styles import style_key
+
+# What the layout of a table depends on: its cells, the widths and heights
+# it was given and the commands of its TableStyle
+_TABLE_ATTRIBUTES = (
+  '_cellvalues', '_argW', '_argH', '_minRowHeights', '_bkgrndcmds', '_linecmds', '_spanCmds', '_nosplitCmds',
+  '_srflcmds', '_sircmds', '_rowSplitRange', 'repeatRows', 'repeatCols', 'splitByRow', 'splitInRow', 'hAlign',
+  'vAlign', 'spaceBefore', 'spaceAfter'
+)
+
+# The same for reportlab's containers, whose children are compared by their fingerprints
+_CONTAINER_ATTRIBUTES = {
+  KeepTogether: ('_content', '_maxHeight'),
+  KeepInFrame: ('_content', 'maxWidth', 'maxHeight', 'mode', 'mergespace', 'fakeWidth', 'hAlign', 'vAlign'),
+  # Laying a list out replaces _flowables with the indented items, it then gives None
+  ListFlowable: ('_flowables', '_start', '_auto', '_caption', 'spaceBefore', 'spaceAfter')
+                + tuple('_' + name for name in sorted(ListStyle.defaults)),
+}
+
+# Stands for a value that can not be compared
+_UNKNOWN = object()
+
+def fingerprint(flowable):
+  """
+  Return a value that is equal for flowables that lay out the same way.
+
+  Paragraphs, spacers, page breaks and images are compared by content,
+  tables by their cells, sizes and style commands, and keep-together,
+  keep-in-frame and list flowables by their options and the fingerprints
+  of their children. Flowables with a fingerprint() method are compared by
+  what it returns. Every other flowable gives None, which never counts as
+  unchanged, and so does a table or container with such a child.
+
+  Args:
+      flowable (Flowable): A flowable of a story
+
+  Returns:
+      The fingerprint, or None when the flowable can not be compared
+  """
+  method = getattr(flowable, 'fingerprint', None)
+  if method is not None:
+    return (type(flowable), method())
+
+  kind = type(flowable)
+  if kind is Paragraph:
+    # The fragments hold the text of <seq> tags, numbered when the paragraph was created
+    return (kind, flowable.text, style_key(flowable.style), flowable.bulletText,
+            tuple(getattr(frag, 'text', None) for frag in flowable.frags))
+  if kind is Spacer or kind is CondPageBreak:
+    return (kind, flowable.width if kind is Spacer else None, flowable.height)
+  if issubclass(kind, PageBreak) and kind.__module__ == PageBreak.__module__:
+    return (kind, flowable.nextTemplate)
+  if kind is Image and isinstance(flowable.filename, str):
+    try:
+      stat = os.stat(flowable.filename)
+    except OSError:
+      return None
+    return (kind, flowable.filename, stat.st_mtime_ns, stat.st_size, flowable.drawWidth, flowable.drawHeight,
+            flowable.hAlign, flowable._mask)
+  if issubclass(kind, Table) and kind.__module__ == Table.__module__:
+    styles = [[sorted(vars(cell).items()) for cell in row] for row in flowable._cellStyles]
+    return _attributes_fingerprint(flowable, _TABLE_ATTRIBUTES, styles)
+  for container, names in _CONTAINER_ATTRIBUTES.items():
+    if issubclass(kind, container) and kind.__module__ == container.__module__:
+      return _attributes_fingerprint(flowable, names)
+  return None
+
+def _attributes_fingerprint(flowable, names, *extra):
+  values = _value_fingerprint([getattr(flowable, name, None) for name in names] + list(extra))
+  return None if values is _UNKNOWN else (type(flowable), values)
+
+def _value_fingerprint(value):
+  if value is None or isinstance(value, (str, bytes, int, float, Color)):
+    return value
+  if isinstance(value, (list, tuple)):
+    values = tuple(_value_fingerprint(item) for item in value)
+    return _UNKNOWN if any(item is _UNKNOWN for item in values) else values
+  if isinstance(value, Flowable):
+    result = fingerprint(value)
+    return _UNKNOWN if result is None else result
+  if type(value) is ListItem:
+    values = _value_fingerprint((value._flowables, sorted(value._params.items())))
+    return _UNKNOWN if values is _UNKNOWN else (ListItem, values)
+  return _UNKNOWN
+
+class _PageLayout:
+  """How one page of a build was laid out."""
+
+  __slots__ = ('start', 'fragments', 'events', 'end', 'opaque')
+
+  def __init__(self, start, fragments):
+    # Index in the story of the first flowable that was not started before the page
+    self.start = start
+    # Split parts carried over from the previous page, laid out before story[start]
+    self.fragments = fragments
+    # (flowable, x, y, _sW) for every flowable drawn and NextPageTemplates, in order
+    self.events = []
+    # The PageBreak that ended the page, if one did
+    self.end = None
+    # Set when the page did something a replay can not repeat
+    self.opaque = False
+
+class _ReplayedFlowables(Flowable):
+  """Draws flowables again at the positions an earlier build placed them."""
+
+  def __init__(self, placements):
+    super().__init__()
+    self.placements = placements
+
+  def wrap(self, availWidth, availHeight):
+    return 0, 0
+
+  def drawOn(self, canvas, x, y, _sW=0):
+    doc = getattr(canvas, '_doctemplate', None)
+    for flowable, fx, fy, sW in self.placements:
+      flowable.drawOn(canvas, fx, fy, sW)
+      if doc is not None:
+        doc.afterFlowable(flowable)
+
+def replay_flowables(pages, last_end=True):
+  """
+  Return flowables that draw recorded pages again without laying them out.
+
+  Args:
+      pages (list): Page layouts recorded by an IncrementalDocTemplate build
+      last_end (bool): End the last page with a page break too
+
+  Returns:
+      list: Flowables drawing one page each, separated by page breaks
+  """
+  flowables = []
+  for n, layout in enumerate(pages):
+    placements = []
+    for event in layout.events:
+      if isinstance(event, tuple):
+        placements.append(event)
+        continue
+      if placements:
+        flowables.append(_ReplayedFlowables(placements))
+        placements = []
+      flowables.append(event)
+    if placements:
+      flowables.append(_ReplayedFlowables(placements))
+    if last_end or n < len(pages) - 1:
+      flowables.append(layout.end or PageBreak())
+  return flowables
+
+class _RecordingFrame(Frame):
+  """A Frame that tells its document where it drew every flowable."""
+
+  def __deepcopy__(self, memo):
+    # Containers measure their content on a copy of the frame, which reports to the same document
+    frame = type(self).__new__(type(self))
+    memo[id(self)] = frame
+    memo[id(self._doctemplate)] = self._doctemplate
+    vars(frame).update(deepcopy(vars(self), memo))
+    return frame
+
+  def add(self, flowable, canv, trySplit=0):
+    placed = []
+
+    def drawOn(canvas, x, y, _sW=0):
+      placed.append((x, y, _sW))
+      if self._doctemplate.draws:
+        return type(flowable).drawOn(flowable, canvas, x, y, _sW)
+
+    try:
+      flowable.drawOn = drawOn
+    except AttributeError:
+      # No instance attributes, so its position can not be known
+      self._doctemplate._record_opaque()
+      return Frame.add(self, flowable, canv, trySplit)
+    try:
+      drawn = Frame.add(self, flowable, canv, trySplit)
+    finally:
+      del flowable.drawOn
+    if drawn and placed:
+      self._doctemplate._record_draw(flowable, *placed[0])
+    elif drawn and getattr(flowable, 'frameAction', None):
+      self._doctemplate._record_opaque()
+    return drawn
+
+class IncrementalDocTemplate(SimpleDocTemplate):
+  """
+  A SimpleDocTemplate that lays out again only what changed since its last build.
+
+  Every build remembers which flowables were drawn where on each page and
+  a fingerprint of every flowable of the story. The next build with the
+  same template compares the fingerprints, draws the pages before the
+  first changed flowable again from the recorded positions, without
+  wrapping or splitting anything, and lays out normally from the first
+  page the change can move. Editing the end of a long report costs the
+  layout of the last pages only.
+
+  The recorded layout lives in the template object, so keep the template
+  and call build again with the new story. Changing the page size, the
+  margins, the page functions or the canvas maker lays out everything.
+  Pages with Indenters, frame actions or other ActionFlowables besides
+  NextPageTemplate are always laid out again, as are the pages after them.
+  """
+
+  # Set to False to only record the layout, leaving the pages empty
+  draws = True
+
+  def __init__(self, filename, **kw):
+    super().__init__(filename, **kw)
+    self._pages = []
+    self._fingerprints = []
+    self._layout_key = None
+    self._replayed = 0
+    self._pending = None
+    self._story = None
+    self._page_layout = None
+    # Number of pages drawn from the recorded layout by the last build
+    self.reused_pages = 0
+
+  def build(self, flowables, onFirstPage=_doNothing, onLaterPages=_doNothing, canvasmaker=Canvas):
+    """
+    Build the document, reusing the layout of the previous build where possible.
+
+    Takes the same arguments as SimpleDocTemplate.build. flowables is not
+    changed, so the same list can be edited and built again.
+    """
+    self._calc()
+    story = list(flowables)
+    fingerprints = [fingerprint(flowable) for flowable in story]
+    layout_key = (self.pagesize, self.leftMargin, self.rightMargin, self.topMargin, self.bottomMargin,
+                  onFirstPage, onLaterPages, canvasmaker, self.allowSplitting, self.showBoundary)
+
+    reused = self._reusable_pages(story, fingerprints) if layout_key == self._layout_key else 0
+    pending = replay_flowables(self._pages[:reused])
+    if reused:
+      resume = self._pages[reused]
+      pending.extend(resume.fragments)
+      pending.extend(story[resume.start:])
+    else:
+      pending.extend(story)
+    self._pages = self._pages[:reused]
+
+    self._replayed = reused
+    self._story = story
+    self._pending = pending
+    self._layout_key = None
+    frame = _RecordingFrame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+    frame._doctemplate = self
+    # Templates of earlier builds would otherwise pile up
+    self.pageTemplates = []
+    self.addPageTemplates([
+      PageTemplate(id='First', frames=frame, onPage=onFirstPage, pagesize=self.pagesize),
+      PageTemplate(id='Later', frames=frame, onPage=onLaterPages, pagesize=self.pagesize),
+    ])
+    if onFirstPage is _doNothing and hasattr(self, 'onFirstPage'):
+      self.pageTemplates[0].beforeDrawPage = self.onFirstPage
+    if onLaterPages is _doNothing and hasattr(self, 'onLaterPages'):
+      self.pageTemplates[1].beforeDrawPage = self.onLaterPages
+    try:
+      BaseDocTemplate.build(self, pending, canvasmaker=canvasmaker)
+    except BaseException:
+      # A half recorded layout can not be trusted
+      self._pages = []
+      self._fingerprints = []
+      raise
+    finally:
+      self._pending = None
+      self._story = None
+      self._page_layout = None
+
+    self._fingerprints = fingerprints
+    self._layout_key = layout_key
+    self.reused_pages = reused
+
+  def _reusable_pages(self, story, fingerprints):
+    """Return how many pages of the last build can be drawn again as they are."""
+    old = self._fingerprints
+    changed = 0
+    limit = min(len(old), len(fingerprints))
+    while changed < limit and fingerprints[changed] is not None and fingerprints[changed] == old[changed]:
+      changed += 1
+    # Flowables kept with the next one move with it
+    while changed > 0 and story[changed - 1].getKeepWithNext():
+      changed -= 1
+
+    reused = 0
+    for page, following in zip(self._pages, self._pages[1:]):
+      if page.opaque:
+        break
+      # The page ends before the change, or inside a flowable split before it
+      if not (following.start < changed or (following.start == changed and following.fragments)):
+        break
+      reused += 1
+    return reused
+
+  def handle_pageBegin(self):
+    super().handle_pageBegin()
+    if self._pending is None or self.page <= self._replayed:
+      self._page_layout = None
+      return
+
+    # The untouched end of the pending list is the end of the story
+    pending = self._pending
+    story = self._story
+    start = len(story)
+    count = 0
+    for count, flowable in enumerate(pending):
+      index = len(story) - (len(pending) - count)
+      if 0 <= index < len(story) and flowable is story[index]:
+        start = index
+        break
+    else:
+      count = len(pending)
+    self._page_layout = _PageLayout(start, pending[:count])
+    self._pages.append(self._page_layout)
+
+  def handle_flowable(self, flowables):
+    layout = self._page_layout
+    if layout is not None and flowables is not self._hanging and flowables:
+      flowable = flowables[0]
+      if isinstance(flowable, PageBreak):
+        layout.end = flowable
+      elif isinstance(flowable, NextPageTemplate):
+        layout.events.append(flowable)
+      elif isinstance(flowable, ActionFlowable):
+        layout.opaque = True
+    super().handle_flowable(flowables)
+
+  def _record_draw(self, flowable, x, y, _sW):
+    if self._page_layout is not None:
+      self._page_layout.events.append((flowable, x, y, _sW))
+
+  def _record_opaque(self):
+    if self._page_layout is not None:
+      self._page_layout.opaque = True
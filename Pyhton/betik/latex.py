@@ -0,0 +1,1127 @@
+import os
+import math
+import signal
+import asyncio
+import tempfile
+import shutil
+import hashlib
+import threading
+import weakref
+import subprocess
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+import logging
+import re
+import struct
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from betik.cache import DEFAULT_CACHE_DIR, EquationCache
+from betik.metrics import PipelineMetrics
+
+try:
+  from PIL import Image
+except ImportError:
+  Image = None
+
+try:
+  import resource
+except ImportError:
+  # Not available on Windows, where the processes run without limits
+  resource = None
+
+# Bump whenever a change to the pipeline alters the produced images,
+# so that entries rendered by older versions are not reused.
+CONVERTER_VERSION = 2
+
+DEFAULT_PREAMBLE = r"""\documentclass[12pt]{article}
+\special{papersize=3in,5in}
+\usepackage{amsmath,amsfonts,amssymb}
+\usepackage[active,tightpage]{preview}
+\pagestyle{empty}
+\setlength{\parindent}{0in}
+"""
+
+# Size of a rendered equation in points. height is the part above the
+# baseline and depth the part below it, so the image is height + depth tall.
+EquationMetrics = namedtuple('EquationMetrics', ['width', 'height', 'depth'])
+
+# A rendered equation. path is unique to the equation and the converter
+# settings, so it can be handed to reportlab as is.
+RenderedEquation = namedtuple('RenderedEquation', ['path', 'metrics'])
+
+_PREVIEW_PACKAGE = re.compile(r'\\usepackage(\[[^\]]*\])?\{preview\}')
+_DVIPNG_PAGE = re.compile(r'depth=(-?\d+) height=(-?\d+)')
+_DVISVGM_PAGE = re.compile(
+  r'width=([\d.]+)pt, height=([\d.]+)pt, depth=([\d.]+)pt|graphic size: ([\d.]+)pt x ([\d.]+)pt'
+)
+
+# "! <message>" starts an error in the LaTeX log, "l.<line> <text>" says where it happened
+_LOG_ERROR = re.compile(r'^! (.*)$')
+_LOG_LINE = re.compile(r'^l\.(\d+) ?(.*)$')
+_UNDEFINED_COMMAND = re.compile(r'\\[A-Za-z@]+\s*$')
+
+# Programs already found on the PATH, so that every converter of a process
+# after the first one skips the lookup
+_found_programs = set()
+
+class LaTeXConverter:
+  """A class to convert LaTeX equations to PNG or SVG images."""
+
+  def __init__(self, dpi=300, preamble=DEFAULT_PREAMBLE, cache=None, workers=None, min_batch_size=8,
+               precompile=True, format_dir=None, output_format='png', colors=None, timeout=30,
+               memory_limit=2 * 1024 ** 3, metrics=None, max_batch_timeout=120):
+    """
+    Initialize the converter with specified DPI.
+
+    Args:
+        dpi (int): Dots per inch for the output PNG image
+        preamble (str): Everything that goes before \\begin{document}
+        cache (EquationCache): Cache for rendered equations, None to always render
+        workers (int): Number of latex/dvipng jobs run at the same time,
+            defaults to the number of CPU cores
+        min_batch_size (int): Smallest number of equations worth a job of its own
+        precompile (bool): Dump the preamble into a LaTeX format once and
+            load that instead of compiling the preamble for every document
+        format_dir (str): Folder the precompiled formats are kept in
+        output_format (str): 'png' for bitmaps made by dvipng, 'svg' for
+            vector images made by dvisvgm (dpi is ignored then)
+        colors (int): Re-encode the PNGs with a palette of at most this many
+            colors (2 for a 1-bit image, 16 for 4 bits), None to keep the
+            dvipng output. Needs Pillow.
+        timeout (float): Seconds latex, dvipng or dvisvgm may take per
+            equation before they are killed, None for no limit. It also
+            caps their CPU time.
+        memory_limit (int): Bytes of address space each of those processes
+            may use, None for no limit. Only enforced on Linux.
+        metrics (PipelineMetrics): Where timings and counters are recorded,
+            share one between converters to add them up
+        max_batch_timeout (float): Seconds a run over a whole batch may
+            take at most, however many equations it has. A batch that runs
+            out of time is split in halves, so only a run of the equation
+            that hangs waits for the timeout of one equation.
+    """
+    self.dpi = dpi
+    self.preamble = preamble
+    self.cache = cache
+    self.workers = max(1, workers or os.cpu_count() or 1)
+    self.min_batch_size = max(1, min_batch_size)
+    self.precompile = precompile
+    self.format_dir = format_dir or os.path.join(DEFAULT_CACHE_DIR, 'formats')
+    self._format = None
+    self._format_lock = threading.Lock()
+    # One semaphore per event loop limits the async renders to self.workers
+    self._async_limits = weakref.WeakKeyDictionary()
+    if output_format not in ('png', 'svg'):
+      raise ValueError(f"Unknown output format: {output_format}")
+    self.output_format = output_format
+    self.colors = colors if Image is not None else None
+    self.timeout = timeout
+    self.max_batch_timeout = max_batch_timeout
+    self.memory_limit = memory_limit
+    self.metrics = metrics if metrics is not None else PipelineMetrics()
+    self.required_programs = ['latex', 'dvipng' if output_format == 'png' else 'dvisvgm']
+    self._check_dependencies()
+
+    # Without a cache rendered equations are kept here until the converter is gone
+    self._output_dir = None
+    # Scratch folders of finished renders, emptied and handed to the next one
+    self._workspace = None
+    self._free_scratch = []
+    self._scratch_lock = threading.Lock()
+    # (preamble, format, text before the equations, text after them)
+    self._template = None
+
+    self.logger = logging.getLogger(__name__)
+
+  def _check_dependencies(self):
+    """Check if required programs are installed."""
+    missing = []
+    for program in self.required_programs:
+      if program in _found_programs:
+        continue
+      if shutil.which(program) is None:
+        missing.append(program)
+      else:
+        _found_programs.add(program)
+
+    if missing:
+      raise RuntimeError(
+        f"Required programs are missing: {', '.join(missing)}. "
+        "Please install them using your package manager."
+      )
+
+  def _wrap_equation(self, equation, inline=False):
+    """
+    Strip any delimiters from the equation and wrap it for inline or display math.
+
+    Args:
+        equation (str): The LaTeX equation to convert
+        inline (bool): Whether the equation should be rendered inline
+    """
+    # Remove any \begin{equation} or \[ or $ if they exist
+    equation = equation.strip()
+    # Remove delimiters only from start and end of equation
+    equation = re.sub(r'^(\$|\\\[|\\begin\{equation\})', '', equation)  # Remove opening delimiters
+    equation = re.sub(r'(\$|\\\]|\\end\{equation\})$', '', equation)    # Remove closing delimiters
+
+    if inline:
+      # For inline equations, wrap in $
+      wrapped_equation = f"${equation}$"
+    else:
+      # For display equations, wrap in \[ \]
+      wrapped_equation = f"\\[{equation}\\]"
+
+    if _PREVIEW_PACKAGE.search(self.preamble):
+      # preview.sty records where the baseline is, which dvipng and dvisvgm report back
+      return f"\\begin{{preview}}{wrapped_equation}\\end{{preview}}"
+    return wrapped_equation
+
+  def _document_template(self, fmt=None):
+    """Return the text that goes before and after the equations of a document."""
+    template = self._template
+    if template is None or template[:2] != (self.preamble, fmt):
+      head = ('' if fmt else self.preamble) + "\n\\begin{document}\n"
+      template = self._template = (self.preamble, fmt, head, "\n\\end{document}\n")
+    return template[2:]
+
+  def _create_latex_document(self, equation, inline=False, fmt=None):
+    """
+    Create a complete LaTeX document containing the equation.
+
+    Args:
+        equation (str): The LaTeX equation to convert
+        inline (bool): Whether the equation should be rendered inline
+        fmt (str): Precompiled format holding the preamble, if any
+    """
+    head, tail = self._document_template(fmt)
+    return head + self._wrap_equation(equation, inline) + tail
+
+  def _create_batch_document(self, equations, inlines, fmt=None):
+    """
+    Create a LaTeX document that holds one equation per page.
+
+    Args:
+        equations (list): The LaTeX equations to convert
+        inlines (list): Inline flag of each equation
+        fmt (str): Precompiled format holding the preamble, if any
+    """
+    pages = "\n\\clearpage\n".join(
+      self._wrap_equation(equation, inline) for equation, inline in zip(equations, inlines)
+    )
+    head, tail = self._document_template(fmt)
+    return head + pages + tail
+
+  @contextmanager
+  def _scratch(self):
+    """
+    Lend an empty scratch folder for one render.
+
+    The folders live in a workspace of the converter and are emptied and
+    reused instead of creating and removing a temporary folder per render.
+    """
+    with self._scratch_lock:
+      if self._workspace is None:
+        self._workspace = tempfile.mkdtemp(prefix='betik-scratch-')
+        weakref.finalize(self, shutil.rmtree, self._workspace, ignore_errors=True)
+      scratch = self._free_scratch.pop() if self._free_scratch else tempfile.mkdtemp(dir=self._workspace)
+    try:
+      yield scratch
+    finally:
+      for entry in os.scandir(scratch):
+        if entry.is_dir(follow_symlinks=False):
+          shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+          try:
+            os.remove(entry.path)
+          except OSError:
+            pass
+      with self._scratch_lock:
+        self._free_scratch.append(scratch)
+
+  def _format_name(self):
+    """
+    Return the precompiled format of the current preamble, building it on first use.
+
+    The format is named after a hash of the preamble, so changing the
+    preamble switches to (and if needed builds) a different format.
+
+    Returns:
+        str: Format name to pass to latex, or None to compile the preamble
+             with every document
+    """
+    if not self.precompile:
+      return None
+
+    with self._format_lock:
+      if self._format is not None and self._format[0] == self.preamble:
+        return self._format[1]
+
+      digest = hashlib.sha256(f"{self.preamble}\0{CONVERTER_VERSION}".encode('utf-8')).hexdigest()
+      name = 'betik-' + digest[:16]
+      format_path = os.path.join(self.format_dir, name + '.fmt')
+      # A format left over from another TeX installation fails to load,
+      # so an existing file is only trusted after a test run
+      if not (os.path.exists(format_path) and self._check_format(name)):
+        if not (self._build_format(name) and self._check_format(name)):
+          self.logger.warning("Could not precompile the preamble, it will be compiled with every equation")
+          name = None
+
+      self._format = (self.preamble, name)
+      return name
+
+  def _build_format(self, name):
+    """Dump the preamble into format_dir/<name>.fmt, returns True on success."""
+    try:
+      os.makedirs(self.format_dir, exist_ok=True)
+      with tempfile.TemporaryDirectory() as temp_dir:
+        with open(os.path.join(temp_dir, name + '.tex'), 'w', encoding='utf-8') as f:
+          f.write(self.preamble + "\n\\dump\n")
+
+        self.logger.info("Precompiling preamble...")
+        result = self._run_process(
+          ['latex', '-ini', '-interaction=nonstopmode', f'-jobname={name}', '&latex', name + '.tex'],
+          self._time_limit(),
+          cwd=temp_dir,
+          stdout=DEVNULL,
+          stage='format'
+        )
+        if result is None:
+          return False
+
+        built_path = os.path.join(temp_dir, name + '.fmt')
+        if result[0] != 0 or not os.path.exists(built_path):
+          # latex -ini reports a broken preamble in its log only
+          log = _read_log(os.path.join(temp_dir, name + '.log'))
+          tail = '\n'.join(log[-20:]) or 'latex wrote no log'
+          self.logger.error(f"Precompiling the preamble failed:\n{tail}")
+          return False
+        os.replace(built_path, os.path.join(self.format_dir, name + '.fmt'))
+        return True
+
+    except Exception as e:
+      self.logger.error(f"Precompiling the preamble failed: {str(e)}")
+      return False
+
+  def _check_format(self, name):
+    """Compile a trivial document with the format, returns True if it loads."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+      with open(os.path.join(temp_dir, 'check.tex'), 'w', encoding='utf-8') as f:
+        f.write(self._create_latex_document('x', True, name))
+      return self._run_latex(temp_dir, 'check.tex', name)
+
+  def cache_key(self, equation, inline=False):
+    """
+    Build the cache key of an equation rendered with this converter.
+
+    Args:
+        equation (str): The LaTeX equation
+        inline (bool): Whether the equation is rendered inline
+
+    Returns:
+        str: Key identifying the rendered image
+    """
+    return EquationCache.make_key(
+      equation, self.preamble, self.dpi, bool(inline), self.output_format, self.colors, CONVERTER_VERSION
+    )
+
+  def _from_cache(self, equation, inline):
+    """Return the RenderedEquation of a cached equation, or None on a miss."""
+    key = self.cache_key(equation, inline)
+    cached_path = self.cache.get(key)
+    metadata = None if cached_path is None else self.cache.get_metadata(key)
+    if metadata is None:
+      self.metrics.count('cache_misses')
+      return None
+    self.metrics.count('cache_hits')
+    return RenderedEquation(cached_path, EquationMetrics(**metadata))
+
+  def _store(self, equation, inline, page_path, metrics):
+    """Move a freshly rendered image to its unique location, returns its RenderedEquation."""
+    key = self.cache_key(equation, inline)
+    self.metrics.count('equations_rendered')
+    self.metrics.count('bytes_written', os.path.getsize(page_path))
+    if self.cache is not None:
+      return RenderedEquation(self.cache.put(key, page_path, metrics._asdict()), metrics)
+
+    if self._output_dir is None:
+      self._output_dir = tempfile.mkdtemp(prefix='betik-')
+      weakref.finalize(self, shutil.rmtree, self._output_dir, ignore_errors=True)
+    path = os.path.join(self._output_dir, key + '.' + self.output_format)
+    os.replace(page_path, path)
+    return RenderedEquation(path, metrics)
+
+  def convert_equation(self, equation, output_path, inline=False):
+    """
+    Convert a LaTeX equation to PNG (or SVG).
+
+    Args:
+        equation (str): The LaTeX equation to convert
+        output_path (str): Path where the image should be saved
+        inline (bool): Whether to render the equation inline
+
+    Returns:
+        EquationMetrics: Size and baseline of the image if conversion was
+                         successful, False otherwise
+    """
+    if self.cache is not None:
+      cached = self._from_cache(equation, inline)
+      if cached is not None:
+        shutil.copyfile(cached[0], output_path)
+        return cached[1]
+
+    metrics = self._render(equation, output_path, inline)
+    if not metrics:
+      self.metrics.count('failures')
+    elif self.cache is not None:
+      self.cache.put(self.cache_key(equation, inline), output_path, metrics._asdict())
+    return metrics
+
+  def convert_equations(self, equations, output_paths, inline=False):
+    """
+    Convert many LaTeX equations to images and copy them to the given paths.
+
+    Args:
+        equations (list): The LaTeX equations to convert
+        output_paths (list): Path where each image should be saved
+        inline (bool or list): Whether to render the equations inline, either
+            for all equations or one flag per equation
+
+    Returns:
+        list: EquationMetrics for every equation that was converted
+              successfully and False for the others, in the same order as
+              the equations
+    """
+    results = []
+    for rendered, output_path in zip(self.render_equations(equations, inline), output_paths):
+      if rendered:
+        shutil.copyfile(rendered.path, output_path)
+        results.append(rendered.metrics)
+      else:
+        results.append(False)
+    return results
+
+  def render_equations(self, equations, inline=False, twin=None):
+    """
+    Render many LaTeX equations with as few latex and dvipng runs as possible.
+
+    Every equation that is not cached yet is written on its own page of a
+    batch document, so the TeX startup cost is paid once per batch instead of
+    once per equation. Large batches are split into chunks that are rendered
+    at the same time on up to self.workers processes.
+
+    Nothing is written to the working directory: the images stay in the
+    cache (or in a private folder of the converter without a cache) under
+    names derived from their content, so concurrent builds can not
+    overwrite each other's equations.
+
+    With a twin, the converter of the other output format, every DVI file
+    latex makes is also converted by the twin, so a document drawn with
+    SVGs and PNGs compiles each equation once.
+
+    Args:
+        equations (list): The LaTeX equations to convert
+        inline (bool or list): Whether to render the equations inline, either
+            for all equations or one flag per equation
+        twin (LaTeXConverter): Converter with the same preamble whose
+            images are made from the same DVI files
+
+    Returns:
+        list: RenderedEquation for every equation that was converted
+              successfully and False for the others, in the same order as
+              the equations. With a twin, (RenderedEquation of this
+              converter, RenderedEquation of the twin) pairs, either of
+              them False when it failed.
+    """
+    if twin is not None and twin.preamble != self.preamble:
+      raise ValueError("A twin converter must have the same preamble")
+    if isinstance(inline, bool):
+      inlines = [inline] * len(equations)
+    else:
+      inlines = [bool(flag) for flag in inline]
+    results = [(False, False)] * len(equations)
+
+    # Equations that appear more than once are only rendered once
+    pending = {}
+    for index, (equation, flag) in enumerate(zip(equations, inlines)):
+      cached = self._from_cache(equation, flag) if self.cache is not None else None
+      if twin is None:
+        twin_cached = False
+      else:
+        twin_cached = twin._from_cache(equation, flag) if twin.cache is not None else None
+      if cached is not None and twin_cached is not None:
+        results[index] = (cached, twin_cached)
+        continue
+      pending.setdefault((equation, flag), []).append(index)
+
+    if pending:
+      self._render_pending(pending, results, twin)
+    if twin is None:
+      return [rendered for rendered, _ in results]
+    return results
+
+  def _render_pending(self, pending, results, twin):
+    """Render the equations of pending, {(equation, inline): indexes}, into results."""
+    jobs = list(pending)
+    chunk_count = min(self.workers, -(-len(jobs) // self.min_batch_size))
+    chunks = [jobs[start::chunk_count] for start in range(chunk_count)]
+
+    if chunk_count == 1:
+      outcomes = [self._convert_jobs(chunks[0], twin)]
+    else:
+      with ThreadPoolExecutor(max_workers=chunk_count) as executor:
+        futures = [executor.submit(self._convert_jobs, chunk, twin) for chunk in chunks]
+        outcomes = []
+        for future in futures:
+          try:
+            outcomes.append(future.result())
+          except Exception as e:
+            # A broken chunk only fails its own equations
+            self.logger.error(f"Conversion failed: {str(e)}")
+            outcomes.append([])
+
+    for chunk, rendered_chunk in zip(chunks, outcomes):
+      for job, rendered in zip(chunk, rendered_chunk):
+        for index in pending[job]:
+          results[index] = rendered
+
+    self.metrics.count('failures', sum(1 for indices in pending.values() if not results[indices[0]][0]))
+
+  async def render_equation_async(self, equation, inline=False, timeout=None):
+    """
+    Render one LaTeX equation without blocking the event loop.
+
+    latex and dvipng (or dvisvgm) run as asyncio subprocesses. At most
+    self.workers equations of a converter are rendered at the same time per
+    event loop, the others wait for a free slot. Cancelling the call kills
+    the running process.
+
+    Args:
+        equation (str): The LaTeX equation to convert
+        inline (bool): Whether to render the equation inline
+        timeout (float): Seconds the rendering may take once it started,
+            defaults to the timeout of the converter
+
+    Returns:
+        RenderedEquation: The rendered equation, False if it could not be
+                          rendered in time or at all
+    """
+    if self.cache is not None:
+      cached = self._from_cache(equation, inline)
+      if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    limit = self._async_limits.get(loop)
+    if limit is None:
+      limit = self._async_limits[loop] = asyncio.Semaphore(self.workers)
+
+    if timeout is None:
+      timeout = self.timeout
+    async with limit:
+      try:
+        rendered = await asyncio.wait_for(
+          self._render_async(equation, inline, self._time_limit(timeout=timeout)), timeout
+        )
+      except asyncio.TimeoutError:
+        self.logger.error(f"Rendering took longer than {timeout} seconds: {equation}")
+        self.metrics.count('timeouts')
+        rendered = False
+    if not rendered:
+      self.metrics.count('failures')
+    return rendered
+
+  async def render_equations_async(self, equations, inline=False, timeout=None):
+    """
+    Render many LaTeX equations concurrently, e.g. all equations of a paragraph.
+
+    Args:
+        equations (list): The LaTeX equations to convert
+        inline (bool or list): Whether to render the equations inline, either
+            for all equations or one flag per equation
+        timeout (float): Seconds each equation may take, defaults to the
+            timeout of the converter
+
+    Returns:
+        list: RenderedEquation for every equation that was converted
+              successfully and False for the others, in the same order as
+              the equations
+    """
+    if isinstance(inline, bool):
+      inlines = [inline] * len(equations)
+    else:
+      inlines = [bool(flag) for flag in inline]
+
+    # Equations that appear more than once are only rendered once
+    jobs = list(dict.fromkeys(zip(equations, inlines)))
+    rendered = await asyncio.gather(
+      *(self.render_equation_async(equation, flag, timeout) for equation, flag in jobs)
+    )
+    by_job = dict(zip(jobs, rendered))
+    return [by_job[job] for job in zip(equations, inlines)]
+
+  def check_equations(self, equations, inline=False):
+    """
+    Compile equations with latex alone and collect the error of each one.
+
+    All equations go into one document and latex keeps going after an
+    error, so usually a single run finds every problem. The errors are
+    mapped back to the equations through the line numbers in the log.
+    Equations after an error latex could not recover from are checked again
+    without the broken ones.
+
+    Args:
+        equations (list): The LaTeX equations to check
+        inline (bool or list): Whether the equations are inline, either
+            for all equations or one flag per equation
+
+    Returns:
+        list: None for every equation that compiles, the LaTeX error
+              message for the others
+    """
+    if isinstance(inline, bool):
+      inlines = [inline] * len(equations)
+    else:
+      inlines = [bool(flag) for flag in inline]
+    errors = [None] * len(equations)
+
+    remaining = list(range(len(equations)))
+    while remaining:
+      found, complete = self._check_batch([equations[i] for i in remaining], [inlines[i] for i in remaining])
+      for n, message in found.items():
+        errors[remaining[n]] = message
+      if complete:
+        break
+      if not found:
+        # The failure can not be pinned on an equation, check them one by one
+        for i in remaining:
+          found, complete = self._check_batch([equations[i]], [inlines[i]])
+          if found or not complete:
+            errors[i] = found.get(0, "LaTeX could not compile the equation")
+        break
+      remaining = [i for n, i in enumerate(remaining) if n not in found]
+    return errors
+
+  def _check_batch(self, equations, inlines):
+    """
+    Run latex once over equations and map the errors of the log to them.
+
+    Returns:
+        tuple: ({equation index: error message}, True if latex got through
+               the whole document and every error was mapped)
+    """
+    fmt = self._format_name()
+    head, tail = self._document_template(fmt)
+    pages = [self._wrap_equation(equation, inline) for equation, inline in zip(equations, inlines)]
+    # Line of the log that each page starts at, pages are separated by \clearpage lines
+    starts = []
+    line = head.count('\n') + 1
+    for page in pages:
+      starts.append(line)
+      line += page.count('\n') + 2
+
+    with self._scratch() as temp_dir:
+      with open(os.path.join(temp_dir, 'check.tex'), 'w', encoding='utf-8') as f:
+        f.write(head + "\n\\clearpage\n".join(pages) + tail)
+      command, env = self._latex_command('check.tex', fmt)
+      result = self._run_process(
+        command, self._time_limit(len(equations)), cwd=temp_dir, env=env, stdout=DEVNULL
+      )
+      if result is not None and result[0] == 0:
+        return {}, True
+      log = _read_log(os.path.join(temp_dir, 'check.log'))
+
+    if result is None:
+      # Timed out, the log ends wherever latex got stuck
+      return {}, False
+
+    found = {}
+    complete = not any(line.startswith('!  ==> Fatal error') or 'Emergency stop' in line for line in log)
+    message = None
+    for text in log:
+      error = _LOG_ERROR.match(text)
+      if error is not None:
+        if message is not None:
+          # An error without a line number
+          complete = False
+        message = error.group(1).strip()
+        continue
+      location = _LOG_LINE.match(text)
+      if location is None or message is None:
+        continue
+      page = bisect_right(starts, int(location.group(1))) - 1
+      if 0 <= page < len(pages) and int(location.group(1)) < starts[page] + pages[page].count('\n') + 1:
+        if message.startswith('Undefined control sequence'):
+          command = _UNDEFINED_COMMAND.search(location.group(2))
+          if command is not None:
+            message += ' ' + command.group().strip()
+        found.setdefault(page, message)
+      else:
+        complete = False
+      message = None
+    if message is not None or not found:
+      complete = False
+    return found, complete
+
+  def _convert_jobs(self, jobs, twin=None):
+    """
+    Render (equation, inline) jobs as one batch.
+
+    Args:
+        jobs (list): (equation, inline) pairs to render
+        twin (LaTeXConverter): Converter also converting the DVI file
+
+    Returns:
+        list: (RenderedEquation, RenderedEquation of the twin) of every
+              job, False for the failed ones and for the twin without one
+    """
+    with self._scratch() as temp_dir:
+      pages, twin_pages = self._render_batch(
+        [equation for equation, _ in jobs], [flag for _, flag in jobs], temp_dir, twin
+      )
+      complete = pages is not None and (twin is None or twin_pages is not None)
+      # A failed batch of one equation is not run again, that would only
+      # repeat the failure (or wait for the timeout once more)
+      if complete or len(jobs) == 1:
+        results = []
+        for n, (equation, flag) in enumerate(jobs):
+          rendered = self._stored(equation, flag, pages[n] if pages else None)
+          twin_rendered = twin._stored(equation, flag, twin_pages[n] if twin_pages else None) if twin else False
+          results.append((rendered, twin_rendered))
+        return results
+    # Render the halves on their own so a single bad equation does not take
+    # the whole batch down with it, and a hanging one only times out alone
+    self.metrics.count('batch_retries')
+    half = len(jobs) // 2
+    return self._convert_jobs(jobs[:half], twin) + self._convert_jobs(jobs[half:], twin)
+
+  def _stored(self, equation, inline, page):
+    """Store a (path, EquationMetrics) page, returns its RenderedEquation or False without one."""
+    if page is None:
+      return False
+    return self._store(equation, inline, *page)
+
+  def _render_batch(self, equations, inlines, temp_dir, twin=None):
+    """
+    Render equations as the pages of one document.
+
+    Returns:
+        tuple: (path, EquationMetrics) of each equation for this converter
+               and for the twin, None instead of either list when the
+               batch could not be rendered as a whole
+    """
+    self.metrics.count('batches')
+    try:
+      fmt = self._format_name()
+      tex_path = os.path.join(temp_dir, 'batch.tex')
+      with open(tex_path, 'w', encoding='utf-8') as f:
+        f.write(self._create_batch_document(equations, inlines, fmt))
+
+      # The whole batch gets the time its equations would get one by one, up to max_batch_timeout
+      timeout = self._time_limit(len(equations))
+      if not self._run_latex(temp_dir, 'batch.tex', fmt, timeout):
+        return None, None
+
+      dvi_path = os.path.join(temp_dir, 'batch.dvi')
+      pages = self._convert_pages(dvi_path, temp_dir, len(equations), timeout)
+      twin_pages = twin._convert_pages(dvi_path, temp_dir, len(equations), timeout) if twin else None
+      return pages, twin_pages
+
+    except Exception as e:
+      self.logger.error(f"Batch conversion failed: {str(e)}")
+      return None, None
+
+  def _convert_pages(self, dvi_path, temp_dir, count, timeout):
+    """
+    Convert the pages of a batch DVI file to the output format.
+
+    Returns:
+        list: (path, EquationMetrics) of each of the count pages, None on failure
+    """
+    page_pattern = os.path.join(temp_dir, 'page%d.' + self.output_format)
+    page_metrics = self._convert_dvi(dvi_path, page_pattern, timeout)
+    if page_metrics is None:
+      return None
+
+    page_paths = [page_pattern % page for page in range(1, count + 1)]
+    if len(page_metrics) != count or not all(os.path.exists(path) for path in page_paths):
+      # An equation that produced no page (or several) would shift every
+      # following one, so the batch can not be mapped back safely
+      self.logger.error("Page count of the batch does not match the equations")
+      return None
+    return list(zip(page_paths, page_metrics))
+
+  def _latex_command(self, tex_name, fmt=None):
+    """Return the latex command line and environment for a file, compiled with fmt if given."""
+    command = ['latex', '-interaction=nonstopmode', tex_name]
+    env = None
+    if fmt:
+      command.insert(1, f'-fmt={fmt}')
+      # The trailing separator keeps the default format search path
+      env = dict(os.environ, TEXFORMATS=self.format_dir + os.pathsep)
+    return command, env
+
+  def _dvi_command(self, dvi_path, output_path):
+    """Return the dvipng or dvisvgm command line converting a DVI file to output_path."""
+    if self.output_format == 'svg':
+      return [
+        'dvisvgm',
+        '--page=1-',
+        '--no-fonts',
+        '--bbox=preview' if _PREVIEW_PACKAGE.search(self.preamble) else '--exact-bbox',
+        '--output=' + output_path,
+        dvi_path
+      ]
+    return [
+      'dvipng',
+      '-D', str(self.dpi),
+      '-T', 'tight',
+      '-bg', 'Transparent',
+      '--depth',
+      '--height',
+      '-o', output_path,
+      dvi_path
+    ]
+
+  def _time_limit(self, equations=1, timeout=None):
+    """
+    Return the timeout of a run over the given number of equations.
+
+    Each equation gets timeout seconds, the converter's timeout by default.
+    """
+    if timeout is None:
+      timeout = self.timeout
+    if timeout is None:
+      return None
+    limit = timeout * max(1, equations)
+    if self.max_batch_timeout is not None:
+      # A bad equation in a big batch must not hold a worker for the time of all of them
+      limit = min(limit, max(self.timeout or timeout, self.max_batch_timeout))
+    return limit
+
+  def _process_options(self):
+    """Popen arguments that start a process in a group of its own."""
+    if os.name == 'nt':
+      return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+  def _limit_process(self, pid, timeout):
+    """Apply the CPU time and memory limits to a freshly started process."""
+    # prlimit sets the limits from outside, a preexec_fn would not be
+    # safe with the worker threads of render_equations
+    if resource is None or not hasattr(resource, 'prlimit'):
+      return
+    try:
+      if timeout is not None:
+        seconds = math.ceil(timeout)
+        resource.prlimit(pid, resource.RLIMIT_CPU, (seconds, seconds + 1))
+      if self.memory_limit is not None:
+        resource.prlimit(pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+    except (OSError, ValueError):
+      # The process may already be gone, or the limits above the hard ones
+      pass
+
+  def _kill_process(self, process):
+    """Kill a process together with everything it started."""
+    try:
+      if os.name == 'nt':
+        process.kill()
+      else:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+      pass
+
+  def _run_process(self, command, timeout=None, cwd=None, env=None, stdout=PIPE, stage=None):
+    """
+    Run a command in its own process group with the converter's limits.
+
+    Args:
+        command (list): Program and arguments
+        timeout (float): Seconds after which the process group is killed
+        cwd (str): Working directory of the process
+        env (dict): Environment of the process, None to inherit it
+        stdout: PIPE to capture the output, DEVNULL to discard it
+        stage (str): Name the run time is recorded under in the metrics,
+            defaults to the program name
+
+    Returns:
+        tuple: (returncode, stdout, stderr), None if the process timed out
+    """
+    with self.metrics.timed(stage or command[0]):
+      process = Popen(command, cwd=cwd, env=env, stdout=stdout, stderr=PIPE, **self._process_options())
+      self._limit_process(process.pid, timeout)
+      try:
+        output, errors = process.communicate(timeout=timeout)
+      except TimeoutExpired:
+        self._kill_process(process)
+        process.communicate()
+        self.logger.error(f"{command[0]} took longer than {timeout} seconds and was killed")
+        self.metrics.count('timeouts')
+        return None
+      except BaseException:
+        self._kill_process(process)
+        raise
+    return process.returncode, output, errors
+
+  def _run_latex(self, temp_dir, tex_name, fmt=None, timeout=None):
+    """Run latex on a file in temp_dir, returns True on success."""
+    command, env = self._latex_command(tex_name, fmt)
+    result = self._run_process(command, timeout or self._time_limit(), cwd=temp_dir, env=env, stdout=DEVNULL)
+    if result is None:
+      return False
+
+    if result[0] != 0:
+      # TeX writes its errors to the terminal and the log, not to stderr
+      log_path = os.path.join(temp_dir, os.path.splitext(tex_name)[0] + '.log')
+      self.logger.error(f"LaTeX error: {_log_errors(_read_log(log_path))}")
+      return False
+    return True
+
+  def _convert_dvi(self, dvi_path, output_path, timeout=None):
+    """
+    Convert every page of a DVI file to the output format.
+
+    Returns:
+        list: EquationMetrics of each page, None on failure
+    """
+    timeout = timeout or self._time_limit()
+    if self.output_format == 'svg':
+      return self._run_dvisvgm(dvi_path, output_path, timeout)
+    return self._run_dvipng(dvi_path, output_path, timeout)
+
+  def _run_dvisvgm(self, dvi_path, output_path, timeout=None):
+    """Convert every page of a DVI file to SVG, returns the page metrics or None."""
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=output_dir) as svg_dir:
+      result = self._run_process(self._dvi_command(dvi_path, os.path.join(svg_dir, '%p.svg')), timeout)
+      if result is None:
+        return None
+      returncode, stdout, stderr = result
+
+      if returncode != 0:
+        self.logger.error(f"dvisvgm error: {stderr.decode(errors='replace')}")
+        return None
+
+      # dvisvgm zero pads page numbers, so rename the pages to match the
+      # %d pattern dvipng uses for multi-page output
+      for name in os.listdir(svg_dir):
+        page = int(os.path.splitext(name)[0])
+        target = output_path % page if '%d' in output_path else output_path
+        os.replace(os.path.join(svg_dir, name), target)
+
+    return self._dvisvgm_metrics(stdout, stderr)
+
+  def _dvisvgm_metrics(self, stdout, stderr):
+    """Parse the page metrics out of the dvisvgm report, None if a page has none."""
+    # dvisvgm reports the box of every page it processes; with preview.sty
+    # that includes the depth below the baseline
+    metrics = []
+    report = (stdout + stderr).decode(errors='replace')
+    for page_report in report.split('processing page')[1:]:
+      match = _DVISVGM_PAGE.search(page_report)
+      if match is None:
+        return None
+      if match.group(1) is not None:
+        width, height, depth = (float(value) for value in match.group(1, 2, 3))
+      else:
+        width, height, depth = float(match.group(4)), float(match.group(5)), 0.0
+      metrics.append(EquationMetrics(width, height, depth))
+    return metrics
+
+  def _run_dvipng(self, dvi_path, output_path, timeout=None):
+    """Convert every page of a DVI file to PNG, returns the page metrics or None."""
+    result = self._run_process(self._dvi_command(dvi_path, output_path), timeout)
+    if result is None:
+      return None
+    returncode, stdout, stderr = result
+
+    if returncode != 0:
+      self.logger.error(f"dvipng error: {stderr.decode(errors='replace')}")
+      return None
+
+    return self._dvipng_metrics(stdout, output_path)
+
+  def _dvipng_metrics(self, stdout, output_path):
+    """
+    Parse the page metrics out of the dvipng output, reading widths from the PNGs.
+
+    The pages are re-encoded with a small palette on the way when colors is set.
+    """
+    # dvipng prints "[<page> depth=<px> height=<px>]" for every page
+    metrics = []
+    points_per_pixel = 72 / self.dpi
+    for page, (depth, height) in enumerate(_DVIPNG_PAGE.findall(stdout.decode(errors='replace')), 1):
+      page_path = output_path % page if '%d' in output_path else output_path
+      if self.colors:
+        _compact_png(page_path, self.colors)
+      metrics.append(EquationMetrics(
+        _png_width(page_path) * points_per_pixel,
+        int(height) * points_per_pixel,
+        int(depth) * points_per_pixel
+      ))
+    return metrics
+
+  def _render(self, equation, output_path, inline=False):
+    """Run latex and dvipng (or dvisvgm) for a single equation, bypassing the cache."""
+    try:
+      # Borrow an empty scratch folder
+      with self._scratch() as temp_dir:
+        # Create and write LaTeX file
+        fmt = self._format_name()
+        tex_path = os.path.join(temp_dir, 'equation.tex')
+        with open(tex_path, 'w', encoding='utf-8') as f:
+          f.write(self._create_latex_document(equation, inline, fmt))
+
+        # Run latex to create DVI
+        if not self._run_latex(temp_dir, 'equation.tex', fmt):
+          return False
+
+        # Convert DVI to PNG or SVG
+        metrics = self._convert_dvi(os.path.join(temp_dir, 'equation.dvi'), output_path)
+        if not metrics:
+          return False
+
+        return metrics[0]
+
+    except Exception as e:
+      self.logger.error(f"Conversion failed: {str(e)}")
+      return False
+
+  async def _render_async(self, equation, inline=False, timeout=None):
+    """
+    Run latex and dvipng (or dvisvgm) for a single equation as asyncio subprocesses.
+
+    timeout caps the CPU time of each process, the caller enforces the wall time.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+      # Building the format and copying into the cache touch the disk only, so
+      # they run on the default executor instead of in the event loop
+      fmt = await loop.run_in_executor(None, self._format_name)
+      with self._scratch() as temp_dir:
+        with open(os.path.join(temp_dir, 'equation.tex'), 'w', encoding='utf-8') as f:
+          f.write(self._create_latex_document(equation, inline, fmt))
+
+        command, env = self._latex_command('equation.tex', fmt)
+        log_path = os.path.join(temp_dir, 'equation.log')
+        if await self._run_async(command, 'LaTeX', cwd=temp_dir, env=env, log_path=log_path,
+                                 timeout=timeout) is None:
+          return False
+
+        output_path = os.path.join(temp_dir, 'equation.' + self.output_format)
+        output = await self._run_async(
+          self._dvi_command(os.path.join(temp_dir, 'equation.dvi'), output_path),
+          'dvisvgm' if self.output_format == 'svg' else 'dvipng',
+          timeout=timeout
+        )
+        if output is None:
+          return False
+        if self.output_format == 'svg':
+          metrics = self._dvisvgm_metrics(*output)
+        else:
+          # Quantizing the PNG is CPU work, kept out of the event loop as well
+          metrics = await loop.run_in_executor(None, self._dvipng_metrics, output[0], output_path)
+        if not metrics or not os.path.exists(output_path):
+          return False
+
+        return await loop.run_in_executor(None, self._store, equation, inline, output_path, metrics[0])
+
+    except (OSError, ValueError, struct.error) as e:
+      self.logger.error(f"Conversion failed: {str(e)}")
+      return False
+
+  async def _run_async(self, command, name, cwd=None, env=None, log_path=None, timeout=None):
+    """
+    Run a command as an asyncio subprocess, killing it when the caller is cancelled.
+
+    Args:
+        command (list): Program and arguments
+        name (str): Name of the program in error messages
+        cwd (str): Working directory of the process
+        env (dict): Environment of the process, None to inherit it
+        log_path (str): LaTeX log the errors are read from instead of stderr
+        timeout (float): CPU seconds the process may use, None for no limit
+
+    Returns:
+        tuple: (stdout, stderr) on success, None if the command failed
+    """
+    with self.metrics.timed(command[0]):
+      process = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        env=env,
+        stdout=PIPE,
+        stderr=PIPE,
+        **self._process_options()
+      )
+      self._limit_process(process.pid, timeout)
+      try:
+        stdout, stderr = await process.communicate()
+      except BaseException:
+        # Cancelled, usually by a timeout: do not leave the processes running
+        if process.returncode is None:
+          self._kill_process(process)
+        raise
+
+    if process.returncode != 0:
+      if log_path is not None:
+        message = _log_errors(_read_log(log_path))
+      else:
+        message = stderr.decode(errors='replace')
+      self.logger.error(f"{name} error: {message}")
+      return None
+    return stdout, stderr
+
+def _read_log(path):
+  """Return the lines of a LaTeX log, empty if it was not written."""
+  try:
+    with open(path, encoding='utf-8', errors='replace') as f:
+      return f.read().splitlines()
+  except OSError:
+    return []
+
+def _log_errors(log, tail=20):
+  """
+  Return the errors of a LaTeX log with the lines they happened at.
+
+  Falls back to the last lines of the log when it has no "!" lines, e.g.
+  when latex stopped for another reason.
+  """
+  errors = []
+  for n, text in enumerate(log):
+    if _LOG_ERROR.match(text) is None:
+      continue
+    errors.append(text)
+    # The context of the error ends with the l.<line> it happened at
+    for following in log[n + 1:n + 10]:
+      if _LOG_ERROR.match(following) is not None:
+        break
+      if _LOG_LINE.match(following) is not None:
+        errors.append(following)
+        break
+  if not errors:
+    errors = log[-tail:] or ['latex wrote no log']
+  return '\n'.join(errors)
+
+def _compact_png(path, colors):
+  """
+  Re-encode a PNG in place with a palette of at most the given number of colors.
+
+  Black math on a transparent background only needs a few levels of
+  transparency for its anti-aliased edges, so a 4-bit (or 1-bit) palette
+  image is a fraction of the size of the RGBA one and cheaper to decode.
+  """
+  with Image.open(path) as image:
+    image = image.convert('RGBA')
+  # Fast octree is the quantizer that keeps the alpha channel
+  image = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+  # Pillow picks the bit depth from the palette size
+  image.save(path, optimize=True)
+
+def _png_width(path):
+  """Read the pixel width from the header of a PNG file without decoding it."""
+  with open(path, 'rb') as f:
+    header = f.read(24)
+  # 8 byte signature, 4 byte chunk length, 'IHDR', then width and height
+  return struct.unpack('>I', header[16:20])[0]
@@ -0,0 +1,163 @@
+import re
+from collections import namedtuple
+from xml.sax.saxutils import escape, quoteattr
+
+from betik.fastmath import render_simple
+from betik.session import default_session
+
+TEXT = 'text'
+INLINE_MATH = 'inline'
+DISPLAY_MATH = 'display'
+
+# kind is one of TEXT, INLINE_MATH or DISPLAY_MATH. text is the content
+# without delimiters and start/end are the offsets of the whole span,
+# delimiters included, in the source text.
+Segment = namedtuple('Segment', ['kind', 'text', 'start', 'end'])
+
+# Things that matter outside of math: an escaped dollar sign or an opening delimiter
+_TEXT_TOKEN = re.compile(r'\\\$|\\\[|\$\$|\$')
+# Closing delimiters, with escaped characters matched first so \$ or \\] never close
+_CLOSING_TOKEN = {
+  '$': re.compile(r'\\.|\$', re.DOTALL),
+  '$$': re.compile(r'\\.|\$\$', re.DOTALL),
+  '\\[': re.compile(r'\\\\|\\\]|\\.', re.DOTALL),
+}
+_CLOSER = {'$': '$', '$$': '$$', '\\[': '\\]'}
+
+# Markup that replaces an equation that could not be rendered
+FAILED_EQUATION = '<font name="Courier" color="red">%s</font>'
+
+def tokenize(text):
+  """
+  Split text into plain text, inline math and display math segments.
+
+  $...$ is inline math, $$...$$ and \\[...\\] are display math and \\$ is a
+  literal dollar sign. A delimiter that is never closed is kept as text.
+  The text is scanned once, so the cost grows linearly with its length.
+
+  Args:
+      text (str): Paragraph markup with embedded LaTeX
+
+  Returns:
+      list: Segment tuples in source order
+  """
+  segments = []
+  buffer = []
+  buffer_start = 0
+  position = 0
+  length = len(text)
+  # Openers whose closer was already searched for up to the end of the text,
+  # remembered so that many unclosed delimiters do not rescan the rest each time
+  unclosed = set()
+
+  def flush(end):
+    joined = ''.join(buffer)
+    if joined:
+      segments.append(Segment(TEXT, joined, buffer_start, end))
+    buffer.clear()
+
+  while position < length:
+    match = _TEXT_TOKEN.search(text, position)
+    if match is None:
+      break
+    if not buffer:
+      buffer_start = position
+    buffer.append(text[position:match.start()])
+    token = match.group()
+
+    if token == '\\$':
+      buffer.append('$')
+      position = match.end()
+      continue
+
+    closer = None if token in unclosed else _find_closer(text, match.end(), token)
+    if closer is None:
+      unclosed.add(token)
+      # Unterminated math is left in the text as it was written
+      buffer.append(token)
+      position = match.end()
+      continue
+
+    flush(match.start())
+    kind = INLINE_MATH if token == '$' else DISPLAY_MATH
+    segments.append(Segment(kind, text[match.end():closer], match.start(), closer + len(_CLOSER[token])))
+    position = closer + len(_CLOSER[token])
+
+  if position < length:
+    if not buffer:
+      buffer_start = position
+    buffer.append(text[position:])
+  flush(length)
+  return segments
+
+def _find_closer(text, position, opener):
+  """Return the offset of the delimiter closing opener, or None."""
+  closer = _CLOSER[opener]
+  for match in _CLOSING_TOKEN[opener].finditer(text, position):
+    if match.group() == closer:
+      return match.start()
+  return None
+
+def render_latex(text, vector=False, fast=True, session=None):
+  """
+  Replace the math in a paragraph with <img> tags of the rendered equations.
+
+  Args:
+      text (str): Paragraph markup with embedded LaTeX
+      vector (bool): Also render SVGs for EquationCanvas to draw, taken
+          from the session when one is given
+      fast (bool): Set simple inline math (scripts, Greek letters, common
+          operators, plain fractions) with reportlab fonts instead of TeX
+      session (EquationSession): Converters to render with, defaults to the
+          session of the process shared by every call
+
+  Returns:
+      str: Paragraph markup ready for reportlab
+  """
+  if session is None:
+    session = default_session(vector)
+
+  segments = tokenize(text)
+  # Markup of the inline equations simple enough to skip TeX
+  simple = {}
+  if fast:
+    for n, segment in enumerate(segments):
+      if segment.kind == INLINE_MATH:
+        markup = render_simple(segment.text)
+        if markup is not None:
+          simple[n] = markup
+    session.metrics.count('fast_path', len(simple))
+
+  math = [segment for n, segment in enumerate(segments) if segment.kind != TEXT and n not in simple]
+  equations = [segment.text for segment in math]
+  inlines = [segment.kind == INLINE_MATH for segment in math]
+
+  # Render every equation of the text in one latex run
+  rendered = session.render_equations(equations, inline=inlines)
+
+  parts = []
+  latex_counter = 0
+  for n, segment in enumerate(segments):
+    if segment.kind == TEXT:
+      parts.append(segment.text)
+      continue
+    if n in simple:
+      parts.append(simple[n])
+      continue
+    if rendered[latex_counter]:
+      size = rendered[latex_counter].metrics
+      scale = session.scale
+      # A negative valign moves the bottom of the image below the baseline by the depth of the equation
+      parts.append("<img src={src} valign=\"{valign}\" height=\"{height}\" width=\"{width}\"/>".format(
+        src=quoteattr(rendered[latex_counter].path),
+        valign=round(-size.depth * scale, 3),
+        height=round((size.height + size.depth) * scale, 3),
+        width=round(size.width * scale, 3)
+      ))
+    else:
+      # Equations that could not be rendered, or took too long, are shown
+      # as their source so the build goes on and the problem stays visible
+      parts.append(FAILED_EQUATION % escape(text[segment.start:segment.end]))
+    latex_counter += 1
+
+  return ''.join(parts)
@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class PipelineMetrics:
+  """
+  Counters and timings of the equation pipeline.
+
+  Counters are plain event counts (cache_hits, failures, ...), timings add
+  up seconds and the number of runs per stage (latex, dvipng, dvisvgm, ...).
+  Nothing is logged: read the numbers with snapshot(), or pass a callback
+  that is called with (name, value) for every recorded event.
+  """
+
+  def __init__(self, callback=None):
+    """
+    Initialize empty metrics.
+
+    Args:
+        callback (callable): Called as callback(name, value) for every
+            counter increment (value is the increment) and timing (value
+            is the duration in seconds)
+    """
+    self.callback = callback
+    self._counters = {}
+    self._timings = {}
+    self._lock = threading.Lock()
+
+  def count(self, name, value=1):
+    """Add value to the counter called name."""
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + value
+    if self.callback is not None:
+      self.callback(name, value)
+
+  def add_time(self, name, seconds):
+    """Record one run of the stage called name that took seconds."""
+    with self._lock:
+      total, runs = self._timings.get(name, (0.0, 0))
+      self._timings[name] = (total + seconds, runs + 1)
+    if self.callback is not None:
+      self.callback(name, seconds)
+
+  @contextmanager
+  def timed(self, name):
+    """Time the body of a with statement as one run of the stage called name."""
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_time(name, time.perf_counter() - start)
+
+  def snapshot(self):
+    """
+    Return the current numbers.
+
+    Returns:
+        dict: 'counters' maps names to counts, 'timings' maps names to
+              {'seconds': total, 'runs': count}
+    """
+    with self._lock:
+      return {
+        'counters': dict(self._counters),
+        'timings': {
+          name: {'seconds': total, 'runs': runs} for name, (total, runs) in self._timings.items()
+        },
+      }
+
+  def reset(self):
+    """Set every counter and timing back to zero."""
+    with self._lock:
+      self._counters.clear()
+      self._timings.clear()
@@ -0,0 +1,167 @@
+import pickle
+import threading
+from collections import OrderedDict
+
+from reportlab.platypus import Paragraph
+from reportlab.platypus.paragraph import _FUZZ
+
+from betik.styles import style_key
+
+class LayoutCache:
+  """
+  A bounded in-memory cache of parsed and wrapped paragraphs.
+
+  Entries are dropped least recently used first once the cache holds
+  max_entries of them, so memory stays bounded however many documents a
+  process builds.
+  """
+
+  def __init__(self, max_entries=4096):
+    """
+    Initialize the cache.
+
+    Args:
+        max_entries (int): Number of parse, wrap and split results kept
+    """
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """Return the value stored for key, or None."""
+    with self._lock:
+      value = self._entries.get(key)
+      if value is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    """Store value for key, dropping the oldest entries over the limit."""
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+
+  def clear(self):
+    """Drop every entry."""
+    with self._lock:
+      self._entries.clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+# Shared by every CachedParagraph that is not given a cache of its own
+paragraph_cache = LayoutCache()
+
+class CachedParagraph(Paragraph):
+  """
+  A Paragraph that reuses the parsing, line breaking and splitting of equal paragraphs.
+
+  Paragraphs with the same markup, style and bullet share their parsed
+  fragments, and wrap and split results are kept per available width
+  (and height for split). A paragraph appended many times, or rebuilt
+  unchanged for a preview, is broken into lines once. Markup with <seq>
+  tags is parsed every time, as each parse takes the next number.
+
+  Use it like Paragraph. The style is part of the key by identity for the
+  shared read-only styles of betik.styles and by value for other styles.
+
+  Layout sets attributes on the fragments and splitting edits the words of
+  the lines, so the cache holds them pickled and every paragraph unpickles
+  a copy of its own, which is several times faster than deepcopy.
+  Paragraphs whose fragments can not be pickled are not cached.
+  """
+
+  def __init__(self, text, style=None, bulletText=None, frags=None, caseSensitive=1, encoding='utf8',
+               cache=None):
+    self._cache = cache if cache is not None else paragraph_cache
+    self._key = None
+    if frags is not None or text is None or style is None or _numbered(text):
+      super().__init__(text, style, bulletText, frags, caseSensitive, encoding)
+      return
+
+    key = ('parse', text, style_key(style), bulletText, caseSensitive)
+    parsed = self._cache.get(key)
+    if parsed is None:
+      super().__init__(text, style, bulletText, frags, caseSensitive, encoding)
+      frozen = _freeze(self.frags)
+      if frozen is None:
+        return
+      self._cache.put(key, (self.text, frozen, self.style, self.bulletText))
+    else:
+      self.caseSensitive = caseSensitive
+      self.encoding = encoding
+      self.text, frozen, self.style, self.bulletText = parsed
+      self.frags = pickle.loads(frozen)
+      self.debug = 0
+    self._key = key[1:]
+
+  def __getstate__(self):
+    # The cache holds a lock, a paragraph sent to another process uses the cache there
+    state = dict(vars(self))
+    del state['_cache']
+    return state
+
+  def __setstate__(self, state):
+    vars(self).update(state)
+    self._cache = paragraph_cache
+
+  def fingerprint(self):
+    """Return what the layout of the paragraph depends on, see betik.incremental."""
+    return (self.text, style_key(self.style), self.bulletText,
+            tuple(getattr(frag, 'text', None) for frag in self.frags))
+
+  def wrap(self, availWidth, availHeight):
+    if self._key is None or availWidth < _FUZZ:
+      return super().wrap(availWidth, availHeight)
+    key = ('wrap', self._key, availWidth)
+    wrapped = self._cache.get(key)
+    if wrapped is None:
+      width, height = super().wrap(availWidth, availHeight)
+      # The lines refer to the fragments, they are kept together
+      frozen = _freeze((self.frags, self.blPara))
+      if frozen is not None:
+        self._cache.put(key, (frozen, self._wrapWidths, height))
+      return width, height
+    # Line breaking does not depend on the available height
+    frozen, self._wrapWidths, self.height = wrapped
+    self.frags, self.blPara = pickle.loads(frozen)
+    self.width = availWidth
+    return self.width, self.height
+
+  def split(self, availWidth, availHeight):
+    if self._key is None:
+      return super().split(availWidth, availHeight)
+    key = ('split', self._key, availWidth, availHeight)
+    frozen = self._cache.get(key)
+    if frozen is None:
+      parts = super().split(availWidth, availHeight)
+      frozen = _freeze(parts)
+      if frozen is None:
+        return parts
+      self._cache.put(key, frozen)
+    # Every use gets its own parts, layout changes them like the paragraph itself
+    parts = pickle.loads(frozen)
+    for n, part in enumerate(parts):
+      if isinstance(part, CachedParagraph):
+        # Set after unpickling, which would copy the style in the key
+        part._cache = self._cache
+        part._key = (self._key, availWidth, availHeight, n)
+    return parts
+
+def _freeze(value):
+  try:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+  except Exception:
+    return None
+
+def _numbered(text):
+  return (b'<seq' if isinstance(text, bytes) else '<seq') in text
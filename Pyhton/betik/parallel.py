@@ -0,0 +1,175 @@
+import io
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib import fonts as font_maps
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate
+from reportlab.platypus.doctemplate import _doNothing
+from reportlab.platypus.flowables import PageBreak
+
+from betik.fonts import load_ttf
+from betik.incremental import IncrementalDocTemplate, replay_flowables
+
+def split_sections(flowables):
+  """
+  Split a story at its hard page breaks.
+
+  Args:
+      flowables (list): The story
+
+  Returns:
+      list: Lists of flowables, each but the last ending with its PageBreak
+  """
+  sections = [[]]
+  for flowable in flowables:
+    sections[-1].append(flowable)
+    if type(flowable) is PageBreak and flowable.nextTemplate is None:
+      sections.append([])
+  if not sections[-1]:
+    sections.pop()
+  return sections
+
+def font_setup():
+  """
+  Return what another process needs to use the fonts registered in this one.
+
+  Returns:
+      tuple: (name, TTF file) of every registered TrueType font and the
+             family mappings set up with registerFontFamily
+  """
+  ttfs = [
+    (name, font.face.filename) for name, font in pdfmetrics._fonts.items()
+    if isinstance(font, TTFont) and isinstance(getattr(font.face, 'filename', None), str)
+  ]
+  return ttfs, dict(font_maps._tt2ps_map)
+
+def register_font_setup(setup):
+  """Register the fonts returned by font_setup in another process, once."""
+  ttfs, families = setup
+  registered = pdfmetrics.getRegisteredFontNames()
+  for name, filename in ttfs:
+    if name not in registered:
+      pdfmetrics.registerFont(load_ttf(name, filename))
+  for (face, bold, italic), psname in families.items():
+    font_maps.addMapping(face, bold, italic, psname)
+
+class _LayoutDocTemplate(IncrementalDocTemplate):
+  """Lays out a story on empty pages and keeps the recorded positions."""
+
+  draws = False
+
+def _layout_section(geometry, payload, setup):
+  """
+  Lay out one section in a worker process.
+
+  Returns:
+      bytes: The pickled page layouts, or None when the section has to be
+             laid out by the main process
+  """
+  register_font_setup(setup)
+  flowables = pickle.loads(payload)
+  pagesize, margins, allowSplitting = geometry
+  left, right, top, bottom = margins
+  doc = _LayoutDocTemplate(
+    io.BytesIO(), pagesize=pagesize, leftMargin=left, rightMargin=right, topMargin=top, bottomMargin=bottom,
+    allowSplitting=allowSplitting
+  )
+  doc.build(flowables)
+  pages = doc._pages
+  if any(page.opaque for page in pages):
+    return None
+  for page in pages:
+    page.fragments = []
+    for event in page.events:
+      if isinstance(event, tuple):
+        # Set by the frame, they tie the flowable to this process's canvas
+        vars(event[0]).pop('canv', None)
+        vars(event[0]).pop('_frame', None)
+  try:
+    return pickle.dumps(pages, protocol=pickle.HIGHEST_PROTOCOL)
+  except Exception:
+    return None
+
+def _section_result(future):
+  """Return the layout of a section from its worker, None to lay it out in this process."""
+  if future is None:
+    return None
+  try:
+    return future.result()
+  except Exception:
+    # The section failed in the worker, or the pool broke, e.g. when the
+    # worker was killed for running out of memory
+    return None
+
+class ParallelDocTemplate(SimpleDocTemplate):
+  """
+  A SimpleDocTemplate that lays out the sections of a story in parallel.
+
+  Sections are the parts of the story between hard page breaks, so each
+  one starts on a new page and its layout does not depend on the others.
+  They are sent to a process pool, where they are wrapped and split onto
+  pages, and the recorded pages are drawn in order by this process on one
+  canvas. Page numbers, page callbacks, <seq> counters (numbered when the
+  paragraphs were created) and fonts are shared as in a serial build.
+
+  A section that can not be sent to another process, e.g. because a
+  flowable can not be pickled, that uses Indenters or frame actions, or
+  whose worker fails is laid out here as usual. The worker processes need the fonts of this
+  one; TrueType fonts and families registered before build are registered
+  there too.
+  """
+
+  def __init__(self, filename, workers=None, pool=None, **kw):
+    """
+    Initialize the template.
+
+    Args:
+        filename: File name or file object the PDF is written to
+        workers (int): Size of the process pool, defaults to the number
+            of CPUs. With one, the story is laid out serially
+        pool (Executor): A pool to use instead of starting one per build,
+            e.g. one kept warm between documents
+        **kw: SimpleDocTemplate arguments
+    """
+    super().__init__(filename, **kw)
+    self.workers = workers
+    self.pool = pool
+
+  def build(self, flowables, onFirstPage=_doNothing, onLaterPages=_doNothing, canvasmaker=Canvas):
+    """Build the document, laying out its sections in parallel. Takes SimpleDocTemplate.build's arguments."""
+    self._calc()
+    sections = split_sections(list(flowables))
+    workers = self.workers or os.cpu_count() or 1
+    if len(sections) < 2 or (self.pool is None and workers < 2):
+      return super().build([f for section in sections for f in section], onFirstPage, onLaterPages, canvasmaker)
+
+    geometry = (self.pagesize, (self.leftMargin, self.rightMargin, self.topMargin, self.bottomMargin),
+                self.allowSplitting)
+    setup = font_setup()
+    pool = self.pool or ProcessPoolExecutor(workers)
+    try:
+      futures = []
+      for section in sections:
+        try:
+          payload = pickle.dumps(section, protocol=pickle.HIGHEST_PROTOCOL)
+          futures.append(pool.submit(_layout_section, geometry, payload, setup))
+        except Exception:
+          # Can not be pickled, or the pool is already broken
+          futures.append(None)
+      results = [_section_result(future) for future in futures]
+    finally:
+      if pool is not self.pool:
+        pool.shutdown()
+
+    story = []
+    for n, (section, result) in enumerate(zip(sections, results)):
+      if result is None:
+        story.extend(section)
+        continue
+      # A section ended by its PageBreak; the last one must not add an empty page
+      story.extend(replay_flowables(pickle.loads(result), last_end=n < len(sections) - 1))
+    super().build(story, onFirstPage, onLaterPages, canvasmaker)
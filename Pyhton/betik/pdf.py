@@ -0,0 +1,94 @@
+import os
+import hashlib
+
+from reportlab.graphics import renderPDF
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen.canvas import Canvas
+
+try:
+  from svglib.svglib import svg2rlg
+except ImportError:
+  svg2rlg = None
+
+class EquationCanvas(Canvas):
+  """
+  A canvas that draws equation images as vector forms.
+
+  Paragraphs keep placing equations with <img src="eq0.png" .../>. When
+  twins maps the image to an SVG, the SVG is drawn instead of the bitmap;
+  every other image is drawn as it is. Every distinct SVG is stored once in
+  the PDF as a form object and reused wherever the equation appears.
+
+  EquationSession.canvasmaker is this class with the twins of the
+  session's equations, pass it as doc.build(story, canvasmaker=...).
+  """
+
+  def __init__(self, *args, twins=None, **kwargs):
+    """
+    Initialize the canvas.
+
+    Args:
+        *args: Canvas arguments
+        twins (dict): Bitmap path mapped to the SVG of the same equation
+        **kwargs: Other Canvas arguments
+    """
+    super().__init__(*args, **kwargs)
+    self._twins = twins if twins is not None else {}
+    self._equation_forms = {}
+    self._forms_by_digest = {}
+
+  def drawImage(self, image, x, y, width=None, height=None, *args, **kwargs):
+    form = self._equation_form(image)
+    if form is None:
+      return super().drawImage(image, x, y, width, height, *args, **kwargs)
+
+    name, form_width, form_height = form
+    if width is None:
+      width = form_width
+    if height is None:
+      height = form_height
+    self.saveState()
+    self.translate(x, y)
+    self.scale(width / form_width, height / form_height)
+    self.doForm(name)
+    self.restoreState()
+    return (width, height)
+
+  def _equation_form(self, image):
+    """
+    Return the form drawn in place of an image, creating it on first use.
+
+    Args:
+        image: ImageReader or file name handed to drawImage
+
+    Returns:
+        tuple: (form name, width, height), or None to draw the bitmap
+    """
+    file_name = image.fileName if isinstance(image, ImageReader) else image
+    if svg2rlg is None or not isinstance(file_name, str):
+      return None
+
+    svg_path = self._twins.get(file_name)
+    if svg_path is None:
+      return None
+    try:
+      stamp = (file_name, os.stat(svg_path).st_mtime_ns)
+    except OSError:
+      return None
+    if stamp in self._equation_forms:
+      return self._equation_forms[stamp]
+
+    with open(svg_path, 'rb') as f:
+      digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    form = self._forms_by_digest.get(digest)
+    if form is None:
+      drawing = svg2rlg(svg_path)
+      if drawing is not None and drawing.width and drawing.height:
+        name = 'eq' + digest
+        self.beginForm(name, 0, 0, drawing.width, drawing.height)
+        renderPDF.draw(drawing, self, 0, 0)
+        self.endForm()
+        form = (name, drawing.width, drawing.height)
+        self._forms_by_digest[digest] = form
+    self._equation_forms[stamp] = form
+    return form
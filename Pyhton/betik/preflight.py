@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+from betik.fastmath import render_simple
+from betik.markup import INLINE_MATH, TEXT, tokenize
+from betik.session import default_session
+
+# An equation latex rejected. source names the text it came from, line and
+# column (both counted from 1) point at its opening delimiter.
+Problem = namedtuple('Problem', ['source', 'line', 'column', 'equation', 'message'])
+
+def collect_math(sources):
+  """
+  Find every equation of a document.
+
+  Args:
+      sources: Mapping of source name to text, or an iterable of texts
+          (named "paragraph 1", "paragraph 2", ...)
+
+  Returns:
+      list: (source name, text, Segment) for every math segment, in order
+  """
+  if hasattr(sources, 'items'):
+    named = sources.items()
+  else:
+    named = ((f"paragraph {n}", text) for n, text in enumerate(sources, 1))
+
+  found = []
+  for name, text in named:
+    for segment in tokenize(text):
+      if segment.kind != TEXT:
+        found.append((name, text, segment))
+  return found
+
+def preflight(sources, session=None, fast=True):
+  """
+  Check every equation of a document with one latex run before layout.
+
+  Args:
+      sources: Mapping of source name to text, or an iterable of texts
+      session (EquationSession): Session whose converter does the check,
+          defaults to the shared one
+      fast (bool): Skip the equations render_latex sets without TeX
+
+  Returns:
+      list: A Problem for every equation that does not compile, empty
+            when the document is fine
+  """
+  if session is None:
+    session = default_session()
+
+  math = collect_math(sources)
+  if fast:
+    math = [item for item in math if item[2].kind != INLINE_MATH or render_simple(item[2].text) is None]
+  if not math:
+    return []
+
+  # Every distinct equation is compiled once, however often it appears
+  jobs = list(dict.fromkeys((segment.text, segment.kind == INLINE_MATH) for _, _, segment in math))
+  errors = dict(zip(jobs, session.converter.check_equations(
+    [equation for equation, _ in jobs], [flag for _, flag in jobs]
+  )))
+
+  problems = []
+  for name, text, segment in math:
+    message = errors[(segment.text, segment.kind == INLINE_MATH)]
+    if message is None:
+      continue
+    line = text.count('\n', 0, segment.start) + 1
+    column = segment.start - (text.rfind('\n', 0, segment.start) + 1) + 1
+    problems.append(Problem(name, line, column, text[segment.start:segment.end], message))
+  return problems
+
+def format_problems(problems):
+  """
+  Format problems the way compilers report errors, one per line.
+
+  Returns:
+      str: "<source>:<line>:<column>: <message>: <equation>" lines
+  """
+  return '\n'.join(
+    f"{problem.source}:{problem.line}:{problem.column}: {problem.message}: {problem.equation}"
+    for problem in problems
+  )
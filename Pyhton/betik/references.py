@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import weakref
+
+from reportlab.lib.sequencer import Sequencer, getSequencer, setSequencer
+from reportlab.platypus.flowables import AnchorFlowable
+
+# \ref{label}, \eqref{label} and \pageref{label} in paragraph text
+_REFERENCE = re.compile(r'\\(ref|eqref|pageref)\{([^{}]*)\}')
+
+# Shown for a label that is not known yet, like LaTeX does
+UNKNOWN = '??'
+
+# Indexes by their token, so flowables sent to other processes and back find theirs
+_indexes = weakref.WeakValueDictionary()
+
+def _find_index(token):
+  index = _indexes.get(token)
+  return index if index is not None else _AbsentIndex(token)
+
+class ReferenceIndex:
+  """
+  Numbers and pages of the labels of a document, carried from one build to the next.
+
+  References are replaced with the values of the previous build when the
+  paragraphs are created, and every Label drawn records its number and
+  page for the next one. After a build, changed() tells whether a value
+  some reference used is different now; only then does the document have
+  to be built again. build_with_references runs that loop.
+
+  With a path, the index is read from and saved to a JSON file, so the
+  next run of a script starts from the values of the last one and most
+  builds need a single pass.
+  """
+
+  def __init__(self, path=None):
+    """
+    Initialize the index.
+
+    Args:
+        path (str): JSON file the index is read from and saved to, None to
+            keep it in memory only
+    """
+    self.path = path
+    # label -> [number, page] of the last build and of the current one
+    self._previous = {}
+    self._current = {}
+    # (label, 'ref' or 'pageref') -> the value a reference was set with
+    self._used = {}
+    self._token = object()
+    _indexes[id(self._token)] = self
+    if path is not None and os.path.exists(path):
+      with open(path, 'r', encoding='utf-8') as f:
+        self._previous = {label: list(value) for label, value in json.load(f).items()}
+
+  def lookup(self, label):
+    """
+    Return what the last build knew about a label.
+
+    Returns:
+        tuple: (number, page), either of them None when not known
+    """
+    number, page = self._previous.get(label, (None, None))
+    return number, page
+
+  def resolve(self, text, known=None):
+    """
+    Replace the references in paragraph markup with numbers and pages.
+
+    \\ref{label} becomes the number of the label, \\eqref{label} the number
+    in parentheses and \\pageref{label} the page it is on, all linked to the
+    label, or ?? when the previous build did not have the label. The values
+    taken from the previous build are remembered for changed().
+
+    Args:
+        text (str): Paragraph markup
+        known (dict): Label -> number of the labels the current build has
+            defined already, used for \\ref and \\eqref as they are final
+
+    Returns:
+        str: The markup with the references replaced
+    """
+    return _REFERENCE.sub(lambda match: self._replace(match, known or {}), text)
+
+  def _replace(self, match, known):
+    kind, label = match.groups()
+    if kind != 'pageref' and label in known:
+      value = known[label]
+    else:
+      number, page = self.lookup(label)
+      value = page if kind == 'pageref' else number
+      self._used[(label, 'pageref' if kind == 'pageref' else 'ref')] = value
+    text = UNKNOWN if value is None else value
+    if kind == 'eqref':
+      text = '(%s)' % text
+    if value is None:
+      return text
+    return '<a href="#%s">%s</a>' % (label, text)
+
+  def begin(self):
+    """Start recording a build, to be called before its story is created."""
+    self._current = {}
+    self._used = {}
+
+  def define(self, label, number):
+    """Record the number of a label in the current build."""
+    self._current[label] = [number, None]
+
+  def place(self, label, page):
+    """Record the page a label is drawn on in the current build."""
+    self._current.setdefault(label, [None, None])[1] = page
+
+  def __reduce__(self):
+    # A flowable laid out in another process takes a stand-in there and
+    # finds the index again when it comes back to draw
+    return (_find_index, (id(self._token),))
+
+  def changed(self):
+    """
+    Return whether a reference of the last build used a value that changed in it.
+
+    Returns:
+        list: Labels whose references are out of date, empty when the
+              document is right as it is
+    """
+    stale = []
+    for (label, kind), value in self._used.items():
+      number, page = self._current.get(label, (None, None))
+      if (number if kind == 'ref' else page) != value:
+        stale.append(label)
+    return sorted(set(stale))
+
+  def commit(self):
+    """Make the values of the build the ones references are resolved with, and save them."""
+    self._previous = self._current
+    self._current = {}
+    if self.path is not None:
+      temp_path = self.path + '.tmp'
+      with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(self._previous, f, ensure_ascii=False, indent=1)
+      os.replace(temp_path, self.path)
+
+class _AbsentIndex:
+  """Stands for the ReferenceIndex of another process, which records what is drawn."""
+
+  def __init__(self, token):
+    self._token = token
+
+  def __reduce__(self):
+    return (_find_index, (self._token,))
+
+  def lookup(self, label):
+    return None, None
+
+  def resolve(self, text, known=None):
+    return text
+
+  def define(self, label, number):
+    pass
+
+  def place(self, label, page):
+    pass
+
+class Label(AnchorFlowable):
+  """
+  Names the number a counter just took and the page it is drawn on.
+
+  Put it right after the caption whose <seq> tag took the number, e.g.
+  after Paragraph('Görsel <seq template="%(FigureNo+)s"/>', ...) add
+  Label('fig:kanat', index, 'FigureNo'). It takes no space, is drawn on
+  the page of the caption and is a link destination, so \\ref{fig:kanat}
+  jumps to it.
+  """
+
+  def __init__(self, name, index, counter=None):
+    """
+    Initialize the label.
+
+    Args:
+        name (str): The label, as used by \\ref and \\pageref
+        index (ReferenceIndex): Index the label is recorded in
+        counter (str): Sequencer counter whose current value is the
+            number of the label, None for a label with a page only
+    """
+    super().__init__(name)
+    self.index = index
+    self.number = getSequencer().thisf(counter) if counter is not None else None
+    index.define(name, self.number)
+
+  def fingerprint(self):
+    """Return what the layout of the label depends on, see betik.incremental."""
+    return (self._name, self.number)
+
+  def draw(self):
+    super().draw()
+    self.index.place(self._name, self.canv.getPageNumber())
+
+def build_with_references(doc, make_story, index, max_passes=3, **kw):
+  """
+  Build a document again until its references are right.
+
+  Every pass creates the story again, as numbers and references are set
+  when the paragraphs are made, with a fresh reportlab sequencer so the
+  counters start from one. Another pass is made only when a value some
+  reference used changed; with an index saved by an earlier run that is
+  rare. An IncrementalDocTemplate lays out again only from the first
+  paragraph whose reference changed.
+
+  Args:
+      doc: The document template
+      make_story (callable): Returns the flowables, called once per pass
+      index (ReferenceIndex): Index used by the story's references and labels
+      max_passes (int): Passes made at most, references may still be out of
+          date after the last one if pages keep moving
+      **kw: Arguments of doc.build
+
+  Returns:
+      int: Number of passes made
+  """
+  for passes in range(1, max_passes + 1):
+    setSequencer(Sequencer())
+    index.begin()
+    doc.build(make_story(), **kw)
+    stale = index.changed()
+    index.commit()
+    if not stale:
+      break
+  return passes
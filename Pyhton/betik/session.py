@@ -0,0 +1,135 @@
+import threading
+from functools import partial
+
+from reportlab.pdfgen.canvas import Canvas
+
+from betik.cache import EquationCache
+from betik.latex import LaTeXConverter
+from betik.metrics import PipelineMetrics
+from betik.pdf import EquationCanvas
+
+# Equations are drawn slightly smaller than the 12pt text around them, the
+# size the 1600 DPI images had when they were scaled down by 25
+EQUATION_SCALE = 64 / 72
+
+class EquationSession:
+  """
+  The converters used to render the equations of paragraphs.
+
+  A session creates its converters on first use and keeps them, so the
+  dependency checks, the precompiled format, the scratch folders and the
+  cache are set up once and shared by every paragraph and document rendered
+  with it. Sessions are safe to use from several threads.
+  """
+
+  def __init__(self, vector=False, cache_dir=None, scale=EQUATION_SCALE, output_dpi=600, colors=16,
+               metrics=None):
+    """
+    Initialize the session.
+
+    Args:
+        vector (bool): Also render SVGs for EquationCanvas to draw
+        cache_dir (str): Folder of the equation cache, defaults to the
+            folder of EquationCache
+        scale (float): Size the equations are drawn at relative to their
+            natural TeX size
+        output_dpi (int): Resolution the PNGs should have on the page
+        colors (int): Palette size of the PNGs, None for dvipng's output
+        metrics (PipelineMetrics): Where the converters of the session
+            record their timings and counters
+    """
+    self.vector = vector
+    self.cache_dir = cache_dir
+    self.scale = scale
+    self.output_dpi = output_dpi
+    self.colors = colors
+    self.metrics = metrics if metrics is not None else PipelineMetrics()
+    self._converter = None
+    self._svg_converter = None
+    self._lock = threading.Lock()
+    # PNG path -> SVG path of the equations rendered by the session, drawn by its canvas
+    self.vector_twins = {}
+    # One object, so templates comparing canvas makers between builds see the same one
+    self._canvasmaker = partial(EquationCanvas, twins=self.vector_twins)
+
+  @property
+  def converter(self):
+    """The LaTeXConverter whose PNGs are placed in the paragraphs."""
+    with self._lock:
+      if self._converter is None:
+        self._converter = LaTeXConverter(
+          dpi=self.raster_dpi, cache=EquationCache(self.cache_dir), colors=self.colors, metrics=self.metrics
+        )
+      return self._converter
+
+  @property
+  def raster_dpi(self):
+    """The DPI the PNGs are rendered at to reach output_dpi once drawn at scale."""
+    if self.vector:
+      # The small PNGs are only the <img> sources and fallback, EquationCanvas draws the SVGs
+      return 144
+    # A pixel rendered at d DPI covers scale / d inches on the page
+    return max(1, round(self.output_dpi * self.scale))
+
+  @property
+  def svg_converter(self):
+    """The LaTeXConverter rendering the SVGs, used when vector is set."""
+    with self._lock:
+      if self._svg_converter is None:
+        self._svg_converter = LaTeXConverter(
+          output_format='svg', cache=EquationCache(self.cache_dir, suffix='.svg'), metrics=self.metrics
+        )
+      return self._svg_converter
+
+  @property
+  def canvasmaker(self):
+    """The canvas to build documents with, drawing the SVGs of the session's equations when vector is set."""
+    return self._canvasmaker if self.vector else Canvas
+
+  def render_equations(self, equations, inline=False):
+    """
+    Render equations for paragraphs.
+
+    Args:
+        equations (list): The LaTeX equations to convert
+        inline (bool or list): Whether to render the equations inline, either
+            for all equations or one flag per equation
+
+    Returns:
+        list: RenderedEquation for every equation that was converted
+              successfully and False for the others. With vector set the
+              metrics are the exact ones of the SVG.
+    """
+    if not equations:
+      return []
+    if not self.vector:
+      return self.converter.render_equations(equations, inline=inline)
+    rendered = []
+    # dvipng and dvisvgm convert the same DVI files, latex runs once
+    for bitmap, svg in self.converter.render_equations(equations, inline=inline, twin=self.svg_converter):
+      if bitmap and svg:
+        self.vector_twins[bitmap.path] = svg.path
+        # The SVG boxes are exact, the PNG ones are rounded to whole pixels
+        bitmap = bitmap._replace(metrics=svg.metrics)
+      rendered.append(bitmap)
+    return rendered
+
+_default_sessions = {}
+_default_sessions_lock = threading.Lock()
+
+def default_session(vector=False):
+  """
+  Return the session shared by every caller of this process.
+
+  Args:
+      vector (bool): Whether the session also renders SVGs
+
+  Returns:
+      EquationSession: The same object on every call with the same vector flag
+  """
+  vector = bool(vector)
+  with _default_sessions_lock:
+    session = _default_sessions.get(vector)
+    if session is None:
+      session = _default_sessions[vector] = EquationSession(vector=vector)
+    return session
@@ -0,0 +1,85 @@
+
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate
+from reportlab.platypus.doctemplate import _doNothing
+
+_END = object()
+
+class _StreamingStory(list):
+  """
+  The pending flowables of a build, taken from an iterator as layout needs them.
+
+  reportlab only looks at the front of the list, removing flowables as
+  they are drawn and putting split parts back. The list is refilled
+  whenever its length is asked for, so it never holds more than the
+  lookahead, the parts of a split and a keepWithNext chain with the
+  flowable it is kept with: reportlab groups that chain from what the list
+  holds, so it is always read in full.
+  """
+
+  def __init__(self, flowables, lookahead):
+    super().__init__()
+    self._source = iter(flowables)
+    self._lookahead = lookahead
+
+  def _fill(self, count):
+    """Read until the list holds count flowables and does not end inside a keepWithNext chain."""
+    while self._source is not None:
+      length = list.__len__(self)
+      if length >= count and not (length and list.__getitem__(self, -1).getKeepWithNext()):
+        return
+      flowable = next(self._source, _END)
+      if flowable is _END:
+        self._source = None
+        return
+      self.append(flowable)
+
+  def __len__(self):
+    self._fill(self._lookahead)
+    return list.__len__(self)
+
+  def __getitem__(self, index):
+    if isinstance(index, int) and index >= 0:
+      self._fill(index + 1)
+    return list.__getitem__(self, index)
+
+class StreamingDocTemplate(SimpleDocTemplate):
+  """
+  A SimpleDocTemplate that builds from an iterable of flowables.
+
+  The story is read as layout reaches it, a generator can create the
+  flowables of a chapter only when the previous one is on the page. Drawn
+  flowables, their line breaks and the images they loaded are released
+  right away, so the memory used by the story stays flat however long the
+  document gets. What stays in memory is reportlab's PDF itself, the
+  compressed content of every page and every embedded image once, until
+  the file is written at the end of the build.
+
+  A keepWithNext chain is read in full however long it is, so the layout
+  is the one SimpleDocTemplate gives for any lookahead.
+  """
+
+  def __init__(self, filename, lookahead=64, **kw):
+    """
+    Initialize the template.
+
+    Args:
+        filename: File name or file object the PDF is written to
+        lookahead (int): Number of flowables read ahead of the one being
+            laid out, at least 1
+        **kw: SimpleDocTemplate arguments, page compression is on by default
+    """
+    if lookahead < 1:
+      raise ValueError(f"lookahead must be at least 1, got {lookahead}")
+    kw.setdefault('pageCompression', 1)
+    super().__init__(filename, **kw)
+    self.lookahead = lookahead
+
+  def build(self, flowables, onFirstPage=_doNothing, onLaterPages=_doNothing, canvasmaker=Canvas):
+    """
+    Build the document from an iterable of flowables.
+
+    Takes the same arguments as SimpleDocTemplate.build, but flowables can
+    be any iterable, e.g. a generator. It is consumed by the build.
+    """
+    super().build(_StreamingStory(flowables, self.lookahead), onFirstPage, onLaterPages, canvasmaker)
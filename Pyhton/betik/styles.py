@@ -0,0 +1,292 @@
+import os
+import json
+import threading
+from copy import deepcopy
+from collections.abc import Mapping
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+from reportlab.lib.styles import ListStyle, ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch, toLength
+
+# Names the alignment of a style can be given with in a config file
+ALIGNMENTS = {'left': TA_LEFT, 'center': TA_CENTER, 'right': TA_RIGHT, 'justify': TA_JUSTIFY}
+
+# Style classes a config file can create, by the value of its "type" key
+STYLE_TYPES = {'paragraph': ParagraphStyle, 'list': ListStyle}
+
+class _FrozenStyle:
+  """
+  Mixin that makes a style read-only once it is in a StyleSheet.
+
+  __class__ still reports the plain reportlab class, so clone() and
+  ParagraphStyle(..., parent=style) create ordinary, editable styles.
+  """
+
+  @property
+  def __class__(self):
+    return self._mutable_class
+
+  def __setattr__(self, key, value):
+    raise AttributeError(f"style {self.name!r} is shared and read-only, use clone() or StyleSheet.variant()")
+
+  def __delattr__(self, key):
+    raise AttributeError(f"style {self.name!r} is shared and read-only, use clone() or StyleSheet.variant()")
+
+  def __reduce_ex__(self, protocol):
+    # Pickled as the plain style and frozen again when loaded
+    return _frozen, (self._mutable_class, dict(vars(self)))
+
+  def __copy__(self):
+    # reportlab copies a style to change it, e.g. Paragraph.split
+    style = object.__new__(self._mutable_class)
+    style.__dict__.update(vars(self))
+    return style
+
+  def __deepcopy__(self, memo):
+    style = object.__new__(self._mutable_class)
+    memo[id(self)] = style
+    style.__dict__.update(deepcopy(vars(self), memo))
+    return style
+
+class FrozenParagraphStyle(_FrozenStyle, ParagraphStyle):
+  _mutable_class = ParagraphStyle
+
+class FrozenListStyle(_FrozenStyle, ListStyle):
+  _mutable_class = ListStyle
+
+_FROZEN_CLASSES = {ParagraphStyle: FrozenParagraphStyle, ListStyle: FrozenListStyle}
+
+def freeze(style):
+  """
+  Return a read-only copy of a ParagraphStyle or ListStyle.
+
+  Styles that are read-only already are returned as they are.
+  """
+  if isinstance(style, _FrozenStyle):
+    return style
+  return _frozen(type(style), vars(style))
+
+def _frozen(cls, state):
+  style = object.__new__(_FROZEN_CLASSES[cls])
+  style.__dict__.update(state)
+  return style
+
+def style_key(style):
+  """
+  Return a value that is equal for styles that look the same.
+
+  Read-only styles are their own key, as they can not change; other styles
+  are compared by their attributes.
+  """
+  if isinstance(style, _FrozenStyle):
+    return style
+  return repr(sorted(vars(style).items(), key=lambda item: item[0]))
+
+class StyleSheet(Mapping):
+  """
+  A read-only set of named styles, shared by every builder of a process.
+
+  Lookups are plain dictionary lookups. Styles can not be added, replaced
+  or changed; variant() and extend() return new styles and sheets instead.
+  """
+
+  def __init__(self, styles):
+    """
+    Initialize the sheet.
+
+    Args:
+        styles (dict): Name of the style mapped to a ParagraphStyle or ListStyle
+    """
+    self._styles = {name: freeze(style) for name, style in styles.items()}
+    self._variants = {}
+    self._lock = threading.Lock()
+
+  def __getitem__(self, name):
+    return self._styles[name]
+
+  def __iter__(self):
+    return iter(self._styles)
+
+  def __len__(self):
+    return len(self._styles)
+
+  def __repr__(self):
+    return f"<StyleSheet {', '.join(self._styles)}>"
+
+  def variant(self, name, **overrides):
+    """
+    Return the style called name with some attributes changed.
+
+    The variant is created on the first call and the same read-only object
+    is returned by later calls with the same arguments.
+
+    Args:
+        name (str): Name of the style in the sheet
+        **overrides: Attributes that differ from the style
+
+    Returns:
+        The read-only style
+    """
+    if not overrides:
+      return self._styles[name]
+    # Colors and other values are not always hashable
+    key = (name, tuple(sorted((attribute, repr(value)) for attribute, value in overrides.items())))
+    with self._lock:
+      style = self._variants.get(key)
+      if style is None:
+        style = self._variants[key] = freeze(self._styles[name].clone(name, **overrides))
+      return style
+
+  def extend(self, styles):
+    """Return a new sheet with the styles of this one and the given ones, which win."""
+    return StyleSheet({**self._styles, **styles})
+
+def _report_styles():
+  base = ParagraphStyle(
+    name='metin', fontName='Times', fontSize=12, leading=12, leftIndent=0, rightIndent=0, firstLineIndent=0,
+    alignment=TA_LEFT, textColor='black', uriWasteReduce=0.3, allowWidows=0
+  )
+  bullets = dict(
+    leftIndent=inch/4, rightIndent=0, bulletColor='black', bulletFontName='Times', bulletFontSize=12,
+    bulletDedent=inch/8
+  )
+  return {
+    'Metin':       base,
+    # autoLeading makes room for equations taller than a line
+    'Paragraf':    base.clone('paragraf', firstLineIndent=inch/2, alignment=TA_JUSTIFY, autoLeading='max'),
+    'OrtaliMetin': base.clone('ortalimetin', alignment=TA_CENTER),
+    'GorselMetin': base.clone('gorselmetin', alignment=TA_CENTER),
+    'KalinMetin':  base.clone('kalinmetin', fontName='TimesBd', leading=18),
+    'ItalikMetin': base.clone('italikmetin', fontName='TimesIt'),
+    'Baslik':      base.clone('baslik', fontName='TimesBd', leading=18, leftIndent=inch/4),
+    'Kaynakca':    base.clone('kaynakca', leftIndent=inch/2, firstLineIndent=-inch/2, alignment=TA_JUSTIFY),
+    'Madde':       ListStyle(name='madde', bulletAlign='center', bulletType='bullet', start='bulletchar', **bullets),
+    'Liste':       ListStyle(name='liste', bulletAlign='right', bulletType='1', bulletFormat='%s.', **bullets),
+  }
+
+def _sample_styles():
+  sample = getSampleStyleSheet()
+  styles = {name: sample[name] for name in sample.byName}
+  styles['CodeBlock'] = ParagraphStyle(
+    name='CodeBlock',
+    parent=sample['Code'],
+    backColor=colors.lightgrey,
+    borderPadding=5,
+    borderWidth=0.5,
+    borderColor=colors.grey,
+    fontName='Courier',
+    fontSize=9,
+    leading=12
+  )
+  return styles
+
+_sheets = {}
+_sheets_lock = threading.Lock()
+
+def _shared(key, build):
+  with _sheets_lock:
+    sheet = _sheets.get(key)
+    if sheet is None:
+      sheet = _sheets[key] = build()
+    return sheet
+
+def report_styles():
+  """
+  Return the styles of the TÜBİTAK reports, built once per process.
+
+  Paragraf, Metin, OrtaliMetin, GorselMetin, KalinMetin, ItalikMetin,
+  Baslik and Kaynakca are ParagraphStyles in the Times family, Madde and
+  Liste the ListStyles of bulleted and numbered lists.
+  """
+  return _shared('report', lambda: StyleSheet(_report_styles()))
+
+def sample_styles():
+  """Return reportlab's sample stylesheet with a CodeBlock style, built once per process."""
+  return _shared('sample', lambda: StyleSheet(_sample_styles()))
+
+def load_styles(path, base=None):
+  """
+  Load a StyleSheet from a JSON file.
+
+  The file maps style names to their attributes. A style that is in base
+  already starts from that style, a new one from its "parent" (a style of
+  base or one defined earlier in the file) or from reportlab's defaults.
+  "type" is "paragraph" (the default) or "list". Lengths can be numbers in
+  points or strings with a unit like "0.25in" or "1cm", alignment one of
+  left, center, right and justify. For example
+
+      {"Paragraf": {"firstLineIndent": "0.25in"},
+       "Alinti": {"parent": "Paragraf", "leftIndent": "1cm", "fontName": "TimesIt"}}
+
+  The sheet is kept until the file changes, so loading it again for every
+  preview costs a stat call.
+
+  Args:
+      path (str): The JSON file
+      base (StyleSheet): Styles the file changes and adds to, defaults to
+          report_styles()
+
+  Returns:
+      StyleSheet: base with the styles of the file
+  """
+  base = base if base is not None else report_styles()
+  path = os.path.abspath(path)
+  stat = os.stat(path)
+  stamp = (stat.st_mtime_ns, stat.st_size, id(base))
+  with _sheets_lock:
+    loaded = _sheets.get(path)
+    if loaded is not None and loaded[0] == stamp:
+      return loaded[1]
+  sheet = _load_styles(path, base)
+  with _sheets_lock:
+    _sheets[path] = (stamp, sheet)
+  return sheet
+
+def _load_styles(path, base):
+  with open(path, 'r', encoding='utf-8') as f:
+    config = json.load(f)
+  if not isinstance(config, dict):
+    raise ValueError(f"{path}: expected an object mapping style names to attributes")
+
+  styles = {}
+  for name, attributes in config.items():
+    attributes = dict(attributes)
+    kind = attributes.pop('type', None)
+    parent_name = attributes.pop('parent', None)
+    try:
+      attributes = {key: _style_value(key, value) for key, value in attributes.items()}
+    except ValueError as e:
+      raise ValueError(f"{path}: style {name!r}: {e}") from None
+
+    if parent_name is None and name in base:
+      styles[name] = base[name].clone(base[name].name, **attributes)
+      continue
+    if parent_name is not None:
+      parent = styles.get(parent_name) or base.get(parent_name)
+      if parent is None:
+        raise ValueError(f"{path}: style {name!r}: unknown parent {parent_name!r}")
+      styles[name] = parent.clone(name.lower(), **attributes)
+      continue
+    cls = STYLE_TYPES.get(kind or 'paragraph')
+    if cls is None:
+      raise ValueError(f"{path}: style {name!r}: unknown type {kind!r}")
+    styles[name] = cls(name=name.lower(), **attributes)
+  return base.extend(styles)
+
+def _style_value(key, value):
+  """Convert a value of a config file to what reportlab expects for key."""
+  if key == 'alignment' and isinstance(value, str):
+    try:
+      return ALIGNMENTS[value.lower()]
+    except KeyError:
+      raise ValueError(f"unknown alignment {value!r}") from None
+  if isinstance(value, str) and _is_length(key):
+    try:
+      return toLength(value)
+    except ValueError:
+      raise ValueError(f"{key}: can not read length {value!r}") from None
+  return value
+
+def _is_length(key):
+  return key.endswith(('Indent', 'Dedent', 'Padding', 'Width', 'Size', 'Before', 'After')) or key in ('leading', 'borderRadius')
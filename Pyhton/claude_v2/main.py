@@ -6,164 +6,15 @@ import tempfile
 from tkinter import font
 import webbrowser
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.units import inch
 import io
 from PIL import Image as PILImage, ImageTk
-from html.parser import HTMLParser
 import re
 import fitz  # PyMuPDF library for PDF rendering
+import sys
 
-class MarkdownToPDFConverter(HTMLParser):
-    """Convert HTML to ReportLab elements for PDF generation"""
-    
-    def __init__(self):
-        super().__init__()
-        self.styles = getSampleStyleSheet()
-        # Add some custom styles
-        self.styles.add(ParagraphStyle(
-            name='CodeBlock',
-            parent=self.styles['Code'],
-            backColor=colors.lightgrey,
-            borderPadding=5,
-            borderWidth=0.5,
-            borderColor=colors.grey,
-            fontName='Courier',
-            fontSize=9,
-            leading=12
-        ))
-        
-        self.current_style = self.styles['Normal']
-        self.elements = []
-        self.in_list = False
-        self.list_items = []
-        self.list_type = None
-        self.in_table = False
-        self.table_data = []
-        self.current_row = []
-        self.current_cell = []
-        self.text_buffer = ""
-        
-    def handle_starttag(self, tag, attrs):
-        # Flush any pending text
-        if self.text_buffer and not (self.in_list or self.in_table):
-            self.elements.append(Paragraph(self.text_buffer, self.current_style))
-            self.text_buffer = ""
-            
-        if tag == 'h1':
-            self.current_style = self.styles['Heading1']
-        elif tag == 'h2':
-            self.current_style = self.styles['Heading2']
-        elif tag == 'h3':
-            self.current_style = self.styles['Heading3']
-        elif tag == 'h4':
-            self.current_style = self.styles['Heading4']
-        elif tag == 'h5':
-            self.current_style = self.styles['Heading5']
-        elif tag == 'h6':
-            self.current_style = self.styles['Heading6']
-        elif tag == 'p':
-            self.current_style = self.styles['Normal']
-        elif tag == 'strong' or tag == 'b':
-            self.current_style = self.styles['BodyText']
-        elif tag == 'em' or tag == 'i':
-            self.current_style = self.styles['Italic']
-        elif tag == 'code':
-            self.current_style = self.styles['Code']
-        elif tag == 'pre':
-            self.current_style = self.styles['CodeBlock']
-        elif tag == 'ul':
-            self.in_list = True
-            self.list_type = 'unordered'
-            self.list_items = []
-        elif tag == 'ol':
-            self.in_list = True
-            self.list_type = 'ordered'
-            self.list_items = []
-        elif tag == 'li' and self.in_list:
-            pass  # We'll handle this in handle_data
-        elif tag == 'table':
-            self.in_table = True
-            self.table_data = []
-        elif tag == 'tr' and self.in_table:
-            self.current_row = []
-        elif (tag == 'td' or tag == 'th') and self.in_table:
-            self.current_cell = []
-        elif tag == 'br':
-            self.text_buffer += '<br/>'
-    
-    def handle_endtag(self, tag):
-        if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'strong', 'b', 'em', 'i', 'code', 'pre']:
-            # Add the paragraph with the current style
-            if self.text_buffer:
-                self.elements.append(Paragraph(self.text_buffer, self.current_style))
-                self.text_buffer = ""
-            # Add some space after headings and paragraphs
-            if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p']:
-                self.elements.append(Spacer(1, 0.1 * inch))
-            # Reset to normal style
-            self.current_style = self.styles['Normal']
-        
-        elif tag == 'ul' or tag == 'ol':
-            # Process the list items
-            bullet_type = 'bullet' if self.list_type == 'unordered' else 'number'
-            for item in self.list_items:
-                # Add bullet or number
-                bullet_text = '• ' if bullet_type == 'bullet' else f"{self.list_items.index(item) + 1}. "
-                self.elements.append(Paragraph(f"{bullet_text}{item}", self.styles['Normal']))
-            
-            self.in_list = False
-            self.list_items = []
-            self.list_type = None
-            self.elements.append(Spacer(1, 0.1 * inch))
-        
-        elif tag == 'li' and self.in_list:
-            if self.text_buffer:
-                self.list_items.append(self.text_buffer)
-                self.text_buffer = ""
-        
-        elif tag == 'table':
-            # Process the table
-            if self.table_data:
-                # Create a ReportLab Table
-                table_style = TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ])
-                
-                table = Table(self.table_data)
-                table.setStyle(table_style)
-                self.elements.append(table)
-                self.elements.append(Spacer(1, 0.2 * inch))
-            
-            self.in_table = False
-            self.table_data = []
-        
-        elif tag == 'tr' and self.in_table:
-            if self.current_row:
-                self.table_data.append(self.current_row)
-        
-        elif (tag == 'td' or tag == 'th') and self.in_table:
-            if self.text_buffer:
-                self.current_row.append(Paragraph(self.text_buffer, self.styles['Normal']))
-                self.text_buffer = ""
-    
-    def handle_data(self, data):
-        self.text_buffer += data
-    
-    def get_elements(self):
-        # Flush any remaining text
-        if self.text_buffer:
-            self.elements.append(Paragraph(self.text_buffer, self.current_style))
-        
-        return self.elements
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from betik.convert import MarkdownToPDFConverter
+from betik.incremental import IncrementalDocTemplate
 
 class MarkdownEditor:
     def __init__(self, root):
@@ -175,6 +26,8 @@ class MarkdownEditor:
         self.current_file = None
         self.temp_html_path = None
         self.temp_pdf_path = None
+        # Kept between builds so a preview lays out only what changed
+        self.pdf_doc = IncrementalDocTemplate(None, pagesize=A4)
         
         self.setup_ui()
         self.bind_events()
@@ -474,11 +327,9 @@ class MarkdownEditor:
             with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
                 output_path = pdf_file.name
         
-        doc = SimpleDocTemplate(
-            output_path,
-            pagesize=A4,
-            title=os.path.basename(self.current_file) if self.current_file else 'Markdown Document'
-        )
+        doc = self.pdf_doc
+        doc.filename = output_path
+        doc.title = os.path.basename(self.current_file) if self.current_file else 'Markdown Document'
         
         # Parse the HTML and convert to ReportLab elements
         parser = MarkdownToPDFConverter()
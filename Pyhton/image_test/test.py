@@ -1,27 +1,26 @@
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, Image
-from reportlab.lib.styles import ParagraphStyle
+import os
+import sys
+
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table
 from reportlab.lib.units import cm, inch
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import registerFontFamily
-from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.enums import TA_JUSTIFY
 
 from PIL import Image as PILImg
 
-pdfmetrics.registerFont(TTFont('Times', 'times.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBd', 'timesbd.ttf'))
-pdfmetrics.registerFont(TTFont('TimesIt', 'timesi.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBI', 'timesbi.ttf'))
-registerFontFamily('Times', normal='Times', bold='TimesBd', italic='TimesIt', boldItalic='TimesBI')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from betik.fonts import register_times
+from betik.images import default_pipeline
+from betik.styles import report_styles
+
+register_times()
+
+# Photos are embedded at 200 DPI of the size they are drawn at
+gorseller = default_pipeline()
 
-stiller = {
-  'Paragraf':      ParagraphStyle(name='paragraf', fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=inch/4, alignment=TA_JUSTIFY, uriWasteReduce=0.3, allowWidows=0),
-  'Metin':         ParagraphStyle(name='metin',    fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0),
-  'GorselMetin':   ParagraphStyle(name='metin',    fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_CENTER,  uriWasteReduce=0.3, allowWidows=0),
-  'KalinMetin':    ParagraphStyle(name='metin',    fontName='TimesBd', fontSize=12, leading=18, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0),
-  'Baslik':        ParagraphStyle(name='baslik',   fontName='TimesBd', fontSize=12, leading=18, leftIndent=inch/4, rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT)
-}
+ortak = report_styles()
+# Paragraphs here are indented a quarter inch
+stiller = ortak.extend({'Paragraf': ortak.variant('Paragraf', firstLineIndent=inch/4, autoLeading='')})
 
 page_width, page_height = A4
 page_margin = 2.5 * cm
@@ -40,7 +39,7 @@ with PILImg.open(image_path) as img:
   else:
     resized_height = avaliable_height * .33
     resized_width = img_width / img_height * resized_height
-I_gorsel_1=Image(image_path, width=resized_width, height=resized_height)
+I_gorsel_1=gorseller.image(image_path, width=resized_width, height=resized_height)
 P_gorsel_metin_1=Paragraph(text="<b>Görsel <seq template=\"%(FigureNo+)s\"/></b> <i>barkolorious</i>", style=stiller['GorselMetin'])
 gorsel_1=[[I_gorsel_1], [P_gorsel_metin_1]]
 T_gorsel_1=Table(gorsel_1,style=[('ALIGN', (0, 0), (-1, -1), 'CENTER'),('TOPPADDING', (0, 1), (0, 1), 0), ('BOTTOMPADDING', (0, 0), (0, 0), 0)])
@@ -56,7 +55,7 @@ with PILImg.open(image_path) as img:
   else:
     resized_height = avaliable_height * .33
     resized_width = img_width / img_height * resized_height
-I_gorsel_2 = Image(image_path, width=resized_width, height=resized_height)
+I_gorsel_2 = gorseller.image(image_path, width=resized_width, height=resized_height)
 P_gorsel_metin_2 = Paragraph(text="<b>Görsel <seq template=\"%(FigureNo+)s\"/></b> <i>AEROP</i>", style=stiller['GorselMetin'])
 gorsel_2=[[I_gorsel_2], [P_gorsel_metin_2]]
 T_gorsel_2=Table(gorsel_2,style=[('ALIGN', (0, 0), (-1, -1), 'CENTER'),('TOPPADDING', (0, 1), (0, 1), 0), ('BOTTOMPADDING', (0, 0), (0, 0), 0)])
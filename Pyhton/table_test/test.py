@@ -1,28 +1,25 @@
+import os
+import sys
+
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, Image
-from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import cm, inch
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import registerFontFamily
-from reportlab.pdfbase.ttfonts import TTFont
 
 from PIL import Image as PILImg
 
-pdfmetrics.registerFont(TTFont('Times', 'times.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBd', 'timesbd.ttf'))
-pdfmetrics.registerFont(TTFont('TimesIt', 'timesi.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBI', 'timesbi.ttf'))
-registerFontFamily('Times', normal='Times', bold='TimesBd', italic='TimesIt', boldItalic='TimesBI')
-
-stiller = {
-  'Paragraf':    ParagraphStyle(name='metin',  fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=inch/2, alignment=TA_JUSTIFY, uriWasteReduce=0.3, allowWidows=0, spaceAfter=inch/16, spaceBefore=inch/16),
-  'Metin':       ParagraphStyle(name='metin',  fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0, spaceAfter=0, spaceBefore=0),
-  'OrtaliMetin': ParagraphStyle(name='metin',  fontName='Times',   fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_CENTER,  uriWasteReduce=0.3, allowWidows=0, spaceAfter=0, spaceBefore=0),
-  'Baslik':      ParagraphStyle(name='baslik', fontName='TimesBd', fontSize=12, leading=18, leftIndent=inch/4, rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0, spaceAfter=inch/16, spaceBefore=inch/16),
-  'KalinMetin':  ParagraphStyle(name='metin',  fontName='TimesBd', fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0, spaceAfter=0, spaceBefore=0),
-  'ItalikMetin': ParagraphStyle(name='metin',  fontName='TimesIt', fontSize=12, leading=12, leftIndent=0,      rightIndent=0, firstLineIndent=0,      alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0, spaceAfter=0, spaceBefore=0),
-}
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from betik.fonts import register_times
+from betik.paragraphs import CachedParagraph
+from betik.styles import report_styles
+
+register_times()
+
+ortak = report_styles()
+# The table page keeps its spacing around paragraphs and 12pt bold lines
+stiller = ortak.extend({
+  'Paragraf':   ortak.variant('Paragraf', spaceBefore=inch/16, spaceAfter=inch/16, autoLeading=''),
+  'KalinMetin': ortak.variant('KalinMetin', leading=12),
+})
 
 page_width, page_height = A4
 page_margin = 2.5 * cm
@@ -49,12 +46,12 @@ T_tablo_tum=Table(tablo_tum,style=[('ALIGN', (0, 0), (-1, -1), 'CENTER'),('BOTTO
 story = []
 
 story.append(T_tablo)
-story.append(Paragraph(sample_text, style=stiller['Paragraf']))
+story.append(CachedParagraph(sample_text, style=stiller['Paragraf']))
 story.append(T_tablo_tum)
-story.append(Paragraph(sample_text, style=stiller['Paragraf']))
-story.append(Paragraph(sample_text, style=stiller['Paragraf']))
-story.append(Paragraph(sample_text, style=stiller['Paragraf']))
-story.append(Paragraph(sample_text, style=stiller['Paragraf']))
+story.append(CachedParagraph(sample_text, style=stiller['Paragraf']))
+story.append(CachedParagraph(sample_text, style=stiller['Paragraf']))
+story.append(CachedParagraph(sample_text, style=stiller['Paragraf']))
+story.append(CachedParagraph(sample_text, style=stiller['Paragraf']))
 
 doc = SimpleDocTemplate('doc.pdf', pagesize=A4, leftMargin=page_margin, rightMargin=page_margin, topMargin=page_margin, bottomMargin=page_margin, allowSplitting=1)
 doc.build(story)
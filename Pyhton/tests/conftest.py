@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+# The tests import betik from the folder above, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stand-ins for the TeX programs. latex writes one DVI "page" per preview
+# environment, fails with a TeX style log on \bad and hangs on \hang after
+# writing its pid to hang.pid. Every program appends its command line to the
+# calls file next to it.
+_RECORD = '''#!{python}
+import os, sys, time
+args = sys.argv[1:]
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calls'), 'a') as f:
+  f.write(os.path.basename(__file__) + ' ' + ' '.join(args) + '\\n')
+'''
+
+_LATEX = _RECORD + '''
+job = next((a.split('=', 1)[1] for a in args if a.startswith('-jobname=')), None)
+tex = [a for a in args if a.endswith('.tex')][-1]
+source = open(tex).read()
+base = job or os.path.splitext(os.path.basename(tex))[0]
+if '-ini' in args:
+  if '\\\\broken' in source:
+    open(base + '.log', 'w').write('This is TeX\\n! LaTeX Error: File broken.sty not found.\\n')
+    print('! LaTeX Error')
+    sys.exit(1)
+  open(base + '.fmt', 'w').write('format')
+  sys.exit(0)
+if '\\\\hang' in source:
+  with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hang.pid'), 'w') as f:
+    f.write(str(os.getpid()))
+  time.sleep(60)
+log = ['This is TeX']
+for number, line in enumerate(source.split('\\n'), 1):
+  if '\\\\bad' in line:
+    log += ['! Undefined control sequence.', 'l.%d $\\\\bad' % number, '']
+open(base + '.log', 'w').write('\\n'.join(log) + '\\n')
+if len(log) > 1:
+  print('! Undefined control sequence.')
+  sys.exit(1)
+open(base + '.dvi', 'w').write(str(source.count('\\\\begin{preview}')))
+'''
+
+_DVIPNG = _RECORD + '''
+from PIL import Image
+output, dvi = args[args.index('-o') + 1], args[-1]
+for page in range(1, int(open(dvi).read()) + 1):
+  Image.new('RGBA', (30 + page, 20), (0, 0, 0, 128)).save(output % page if '%d' in output else output)
+  print('[%d depth=3 height=17]' % page, end=' ')
+'''
+
+_DVISVGM = _RECORD + '''
+output, dvi = [a for a in args if a.startswith('--output=')][0].split('=', 1)[1], args[-1]
+pages = int(open(dvi).read())
+for page in range(1, pages + 1):
+  with open(output.replace('%p', '%02d' % page if pages > 9 else str(page)), 'w') as f:
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%dpt" height="10pt" viewBox="0 0 %d 10">'
+            '<rect width="%d" height="10"/></svg>' % (10 + page, 10 + page, 10 + page))
+  sys.stderr.write('processing page %d\\n  width=%d.5pt, height=7.2pt, depth=2.1pt\\n' % (page, 10 + page))
+'''
+
+class FakeTeX:
+  """The folder of the stand-in programs."""
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def calls(self, program=None):
+    """Return the recorded command lines, of one program if given."""
+    try:
+      with open(os.path.join(self.directory, 'calls')) as f:
+        lines = f.read().splitlines()
+    except OSError:
+      return []
+    return [line for line in lines if program is None or line.split(' ', 1)[0] == program]
+
+@pytest.fixture
+def fake_tex(tmp_path, monkeypatch):
+  directory = tmp_path / 'bin'
+  directory.mkdir()
+  for name, source in (('latex', _LATEX), ('dvipng', _DVIPNG), ('dvisvgm', _DVISVGM)):
+    path = directory / name
+    path.write_text(source.replace('{python}', sys.executable, 1))
+    path.chmod(0o755)
+  monkeypatch.setenv('PATH', str(directory) + os.pathsep + os.environ['PATH'])
+  return FakeTeX(str(directory))
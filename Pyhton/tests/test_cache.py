@@ -0,0 +1,56 @@
+import os
+import time
+
+from betik import cache as cache_module
+from betik.cache import EquationCache
+
+def _source(tmp_path, size=100):
+  path = tmp_path / 'source.png'
+  path.write_bytes(b'x' * size)
+  return str(path)
+
+def test_put_scans_the_folder_only_over_the_size_limit(tmp_path, monkeypatch):
+  cache = EquationCache(str(tmp_path / 'cache'), max_bytes=1000)
+  source = _source(tmp_path)
+  scans = []
+  scandir = os.scandir
+  monkeypatch.setattr(cache_module.os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+  for n in range(10):
+    cache.put(EquationCache.make_key(n), source)
+  assert len(scans) == 1
+
+  cache.put(EquationCache.make_key(10), source)
+  assert len(scans) == 2
+  entries = [name for name in os.listdir(cache.directory) if name.endswith('.png')]
+  assert len(entries) * 100 <= 900
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+  cache = EquationCache(str(tmp_path / 'cache'), max_bytes=250)
+  source = _source(tmp_path)
+  keys = [EquationCache.make_key(n) for n in range(3)]
+  for n, key in enumerate(keys[:2]):
+    path = cache.put(key, source, {'n': n})
+    os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+  cache.put(keys[2], source)
+  assert cache.get(keys[0]) is None
+  assert cache.get_metadata(keys[0]) is None
+  assert cache.get(keys[1]) is not None
+
+def test_temporary_files_of_interrupted_puts_are_swept(tmp_path):
+  cache = EquationCache(str(tmp_path / 'cache'))
+  stale = os.path.join(cache.directory, 'tmpabc123.json')
+  fresh = os.path.join(cache.directory, 'tmpdef456.png')
+  for path in (stale, fresh):
+    with open(path, 'w') as f:
+      f.write('{}')
+  old = time.time() - 2 * 60 * 60
+  os.utime(stale, (old, old))
+
+  cache.evict()
+  assert not os.path.exists(stale)
+  assert os.path.exists(fresh)
+
+  cache.put(EquationCache.make_key('entry'), _source(tmp_path))
+  cache.clear()
+  assert os.listdir(cache.directory) == []
@@ -0,0 +1,43 @@
+import io
+import os
+
+import pytest
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+from betik import fonts
+from betik.fonts import load_ttf
+
+TIMES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pdf-latex_test', 'assets', 'times.ttf')
+
+class _Unparsed(TTFont):
+  def __init__(self, *args, **kw):
+    raise AssertionError("the font was parsed")
+
+def _pdf(font):
+  # Registered under the same name, so only the font's data can make the files differ
+  pdfmetrics.registerFont(font)
+  output = io.BytesIO()
+  style = ParagraphStyle('Body', fontName=font.fontName, fontSize=11, leading=14)
+  SimpleDocTemplate(output, invariant=1).build([Paragraph('Çizelge ğüşıöç, AV Wa fi 1234', style)])
+  return output.getvalue()
+
+@pytest.mark.skipif(not os.path.exists(TIMES), reason="needs the Times font of pdf-latex_test")
+def test_cached_fonts_match_parsed_ones(tmp_path, monkeypatch):
+  parsed = load_ttf('CachedTimes', TIMES, str(tmp_path))
+  assert len(os.listdir(tmp_path)) == 1
+  with monkeypatch.context() as patch:
+    # The second load does not parse the file
+    patch.setattr(fonts, 'TTFont', _Unparsed)
+    cached = load_ttf('CachedTimes', TIMES, str(tmp_path))
+
+  assert cached.face.charWidths == parsed.face.charWidths
+  assert cached.stringWidth('Çizelge 1234', 11) == parsed.stringWidth('Çizelge 1234', 11)
+  assert _pdf(cached) == _pdf(parsed)
+
+  # A cache that can not be read is parsed again
+  (path,) = tmp_path.iterdir()
+  path.write_bytes(b'broken')
+  assert _pdf(load_ttf('CachedTimes', TIMES, str(tmp_path))) == _pdf(parsed)
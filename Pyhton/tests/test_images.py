@@ -0,0 +1,55 @@
+import os
+
+from PIL import Image, ImageDraw
+
+from betik.images import ImagePipeline
+
+def _photo(path, size=(1600, 1200), mode='RGB'):
+  # Noise has as many colors as a photo
+  Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode))).save(path)
+  return str(path)
+
+def _diagram(path, size=(1600, 1200), mode='RGB'):
+  image = Image.new(mode, size, (255, 255, 255, 0) if mode == 'RGBA' else 'white')
+  ImageDraw.Draw(image).rectangle((100, 100, 900, 700), fill=(200, 30, 30, 255), outline='black', width=8)
+  image.save(path)
+  return str(path)
+
+def _format(path):
+  with Image.open(path) as image:
+    return image.format, image.mode, image.size
+
+def test_images_are_resampled_to_the_output_resolution(tmp_path):
+  pipeline = ImagePipeline(dpi=100, cache_dir=str(tmp_path / 'cache'))
+  # 144 x 108 points are 200 x 150 pixels at 100 DPI
+  assert _format(pipeline.prepare(_photo(tmp_path / 'photo.png'), 144, 108)) == ('JPEG', 'RGB', (200, 150))
+  assert _format(pipeline.prepare(_photo(tmp_path / 'gray.png', mode='L'), 144, 108)) == ('JPEG', 'L', (200, 150))
+  assert _format(pipeline.prepare(_diagram(tmp_path / 'diagram.png'), 144, 108)) == ('PNG', 'RGB', (200, 150))
+  assert _format(pipeline.prepare(_diagram(tmp_path / 'clear.png', mode='RGBA'), 144, 108)) == ('PNG', 'RGBA', (200, 150))
+
+def test_small_images_are_used_as_they_are(tmp_path):
+  pipeline = ImagePipeline(dpi=100, cache_dir=str(tmp_path / 'cache'))
+  path = _photo(tmp_path / 'small.png', size=(150, 100))
+  assert pipeline.prepare(path, 144, 108) == path
+
+def test_resampled_images_are_cached(tmp_path, monkeypatch):
+  pipeline = ImagePipeline(dpi=100, cache_dir=str(tmp_path / 'cache'))
+  path = _photo(tmp_path / 'photo.jpg')
+  first = pipeline.prepare(path, 144, 108)
+
+  # A new pipeline only hashes the source
+  pipeline = ImagePipeline(dpi=100, cache_dir=str(tmp_path / 'cache'))
+  resample = pipeline._resample
+  monkeypatch.setattr(pipeline, '_resample', None)
+  assert pipeline.prepare(path, 144, 108) == first
+
+  # Another size or quality is another entry
+  monkeypatch.setattr(pipeline, '_resample', resample)
+  assert pipeline.prepare(path, 72, 54) != first
+  assert ImagePipeline(dpi=100, quality=60, cache_dir=str(tmp_path / 'cache')).prepare(path, 144, 108) != first
+
+def test_images_keep_their_aspect_ratio(tmp_path):
+  pipeline = ImagePipeline(dpi=100, cache_dir=str(tmp_path / 'cache'))
+  image = pipeline.image(_photo(tmp_path / 'photo.png'), width=144)
+  assert (image.drawWidth, image.drawHeight) == (144, 108)
+  assert _format(image.filename)[2] == (200, 150)
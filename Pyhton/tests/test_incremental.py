@@ -0,0 +1,46 @@
+import io
+
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import KeepTogether, ListFlowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from betik.incremental import IncrementalDocTemplate, fingerprint
+
+STYLE = ParagraphStyle('Body', fontName='Helvetica', fontSize=11, leading=14)
+
+TEXT = "Some text with <b>bold words</b> that is long enough to take a few lines of the page. " * 6
+
+def _table(cell='Value'):
+  return Table(
+    [['Name', Paragraph(cell, STYLE)], ['Other', [Spacer(1, 4), Paragraph('Nested', STYLE)]]],
+    colWidths=[100, None],
+    style=TableStyle([('GRID', (0, 0), (-1, -1), 0.5, 'black'), ('BACKGROUND', (0, 0), (0, -1), 'lightgrey')]),
+  )
+
+def _story(last):
+  story = [_table(), KeepTogether([Paragraph('Kept', STYLE), _table()]),
+           ListFlowable([Paragraph('First', STYLE), Paragraph('Second', STYLE)], bulletType='1')]
+  for _ in range(60):
+    story += [Paragraph(TEXT, STYLE), Spacer(1, 6)]
+  story.append(Paragraph(last, STYLE))
+  return story
+
+def test_tables_and_containers_are_fingerprinted_by_content():
+  assert fingerprint(_table()) is not None
+  assert fingerprint(_table()) == fingerprint(_table())
+  assert fingerprint(_table()) != fingerprint(_table('Changed'))
+  assert fingerprint(KeepTogether([_table()])) == fingerprint(KeepTogether([_table()]))
+  assert fingerprint(KeepTogether([_table()])) != fingerprint(KeepTogether([_table('Changed')]))
+  assert fingerprint(Table([[object()]])) is None
+
+def test_pages_before_an_edit_are_reused_after_a_table():
+  output = io.BytesIO()
+  doc = IncrementalDocTemplate(output, invariant=1)
+  doc.build(_story('The end.'))
+  output.seek(0)
+  output.truncate()
+  doc.build(_story('A different end.'))
+
+  expected = io.BytesIO()
+  SimpleDocTemplate(expected, invariant=1).build(_story('A different end.'))
+  assert doc.reused_pages > 0
+  assert output.getvalue() == expected.getvalue()
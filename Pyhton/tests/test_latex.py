@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from betik.cache import EquationCache
+from betik.latex import DEFAULT_PREAMBLE, LaTeXConverter
+
+@pytest.fixture
+def converter(fake_tex, tmp_path):
+  return LaTeXConverter(cache=EquationCache(str(tmp_path / 'cache')), workers=1, min_batch_size=64,
+                        format_dir=str(tmp_path / 'formats'), timeout=1, max_batch_timeout=2)
+
+def test_the_equations_of_a_text_take_one_latex_run(converter, fake_tex):
+  converter._format_name()
+  before = len(fake_tex.calls('latex'))
+  rendered = converter.render_equations(['a', r'\frac{1}{2}', 'b^2', 'a', 'c'])
+  assert len(fake_tex.calls('latex')) == before + 1
+  assert len(fake_tex.calls('dvipng')) == 1
+  # Each equation gets the image of its own page, the repeated one is written once
+  assert [Image.open(equation.path).width for equation in rendered] == [31, 32, 33, 31, 34]
+
+def test_chunks_render_at_once_on_at_most_workers_processes(fake_tex, tmp_path, monkeypatch):
+  converter = LaTeXConverter(cache=EquationCache(str(tmp_path / 'cache')), workers=3, min_batch_size=2,
+                             format_dir=str(tmp_path / 'formats'), timeout=1, max_batch_timeout=2)
+  converter._format_name()
+  running = [0]
+  most = []
+  lock = threading.Lock()
+  run_process = converter._run_process
+
+  def counted(*args, **kw):
+    with lock:
+      running[0] += 1
+      most.append(running[0])
+    time.sleep(0.1)
+    try:
+      return run_process(*args, **kw)
+    finally:
+      with lock:
+        running[0] -= 1
+
+  monkeypatch.setattr(converter, '_run_process', counted)
+  equations = [f'x_{n}' for n in range(12)]
+  equations[7] = r'\bad'
+  rendered = converter.render_equations(equations)
+
+  assert max(most) == 3
+  # In document order, and the failure stays with its equation
+  assert [bool(equation) for equation in rendered] == [n != 7 for n in range(12)]
+  assert [equation and equation.path for equation in rendered] == [
+    n != 7 and converter._from_cache(equation, False).path for n, equation in enumerate(equations)
+  ]
+
+def test_a_bad_equation_only_fails_itself(converter):
+  equations = [f'x_{n}' for n in range(8)]
+  equations[5] = r'\bad'
+  rendered = converter.render_equations(equations)
+  assert [bool(result) for result in rendered] == [n != 5 for n in range(8)]
+  assert converter.metrics.snapshot()['counters']['batch_retries'] > 0
+
+def test_a_hanging_equation_is_killed(converter):
+  equations = ['a', r'\hang', 'b', 'c']
+  rendered = converter.render_equations(equations)
+  assert [bool(result) for result in rendered] == [True, False, True, True]
+  assert converter.metrics.snapshot()['counters']['timeouts'] >= 1
+
+def test_latex_errors_are_logged_from_the_log(converter, caplog):
+  with caplog.at_level(logging.ERROR, logger='betik.latex'):
+    assert converter.render_equations([r'\bad']) == [False]
+  messages = [record.getMessage() for record in caplog.records if record.getMessage().startswith('LaTeX error')]
+  assert messages
+  assert '! Undefined control sequence.' in messages[0]
+  assert r'\bad' in messages[0]
+
+def test_a_broken_preamble_logs_the_end_of_the_format_log(fake_tex, tmp_path, caplog):
+  with caplog.at_level(logging.WARNING, logger='betik.latex'):
+    converter = LaTeXConverter(preamble=DEFAULT_PREAMBLE + '\\broken\n',
+                               format_dir=str(tmp_path / 'formats'), workers=1)
+    assert converter._format_name() is None
+  messages = [record.getMessage() for record in caplog.records]
+  assert any('File broken.sty not found.' in message for message in messages)
+  # The preamble is then compiled with every equation instead
+  assert converter.render_equations(['x'])[0]
+
+def _alive(pid):
+  try:
+    with open(f'/proc/{pid}/stat') as f:
+      # A killed process that was not reaped yet is a zombie
+      return f.read().split(') ')[1][0] != 'Z'
+  except OSError:
+    return False
+
+def test_a_cancelled_async_render_kills_latex(converter, fake_tex):
+  rendered = asyncio.run(converter.render_equation_async(r'\hang', timeout=0.5))
+  assert rendered is False
+  with open(os.path.join(fake_tex.directory, 'hang.pid')) as f:
+    pid = int(f.read())
+  deadline = time.monotonic() + 5
+  while _alive(pid) and time.monotonic() < deadline:
+    time.sleep(0.05)
+  assert not _alive(pid)
+  # The converter is still usable afterwards
+  assert asyncio.run(converter.render_equation_async('x'))
+
+def test_async_renders_get_the_cpu_time_of_their_call(converter, monkeypatch):
+  # The format is built by a run of its own
+  converter._format_name()
+  limits = []
+  monkeypatch.setattr(converter, '_limit_process', lambda pid, timeout: limits.append(timeout))
+  assert asyncio.run(converter.render_equation_async('y', timeout=1.5))
+  assert set(limits) == {1.5}
+  limits.clear()
+  # Capped like a batch, at max_batch_timeout
+  assert asyncio.run(converter.render_equation_async('z', timeout=600))
+  assert set(limits) == {2}
+
+def test_check_equations_maps_log_lines_to_equations(converter, fake_tex):
+  # A multi-line equation moves the lines of those after it
+  equations = ['a', 'b\n+ c\n+ d', r'x + \bad', 'e', r'\bad']
+  # Building and checking the format runs latex too
+  converter._format_name()
+  before = len(fake_tex.calls('latex'))
+  errors = converter.check_equations(equations, inline=[True, False, True, True, False])
+  assert [error is not None for error in errors] == [False, False, True, False, True]
+  assert errors[2] == r'Undefined control sequence. \bad'
+  # latex got through the whole document, a single run found both errors
+  assert len(fake_tex.calls('latex')) == before + 1
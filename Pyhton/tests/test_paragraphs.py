@@ -0,0 +1,30 @@
+import io
+
+from reportlab.lib.enums import TA_JUSTIFY
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from betik.paragraphs import CachedParagraph, LayoutCache
+
+STYLE = ParagraphStyle('Justified', fontName='Helvetica', fontSize=11, leading=14, alignment=TA_JUSTIFY)
+
+# Long enough to be split across pages at both of its places in the story
+TEXT = "Some text with <u>underlined words</u> and <b>bold ones</b> that goes on. " * 60
+
+def _build(make):
+  output = io.BytesIO()
+  SimpleDocTemplate(output, invariant=1).build([make(TEXT, STYLE), Spacer(1, 100), make(TEXT, STYLE)])
+  return output.getvalue()
+
+def test_repeated_split_paragraph_matches_paragraph():
+  cache = LayoutCache()
+  expected = _build(Paragraph)
+  for _ in range(2):
+    assert _build(lambda text, style: CachedParagraph(text, style, cache=cache)) == expected
+  assert cache.hits
+
+def test_layout_does_not_change_the_cached_fragments():
+  cache = LayoutCache()
+  _build(lambda text, style: CachedParagraph(text, style, cache=cache))
+  paragraph = CachedParagraph(TEXT, STYLE, cache=cache)
+  assert not any(hasattr(frag, '_fkind') for frag in paragraph.frags)
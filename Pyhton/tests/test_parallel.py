@@ -0,0 +1,71 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+from reportlab.platypus.flowables import Flowable
+
+from betik import parallel
+from betik.parallel import ParallelDocTemplate
+
+STYLE = ParagraphStyle('Body', fontName='Helvetica', fontSize=11, leading=14)
+
+TEXT = "Some text with <b>bold words</b> that is long enough to take a few lines of the page. " * 8
+
+_MAIN = os.getpid()
+
+class _FailsInWorkers(Flowable):
+  """Lays out in the main process only."""
+
+  def wrap(self, availWidth, availHeight):
+    if os.getpid() != _MAIN:
+      raise RuntimeError("not here")
+    return availWidth, 20
+
+  def draw(self):
+    self.canv.rect(0, 0, self.width, 20)
+
+class _KillsWorkers(_FailsInWorkers):
+  """Ends the worker process that unpickles it, which breaks the pool."""
+
+  def __setstate__(self, state):
+    if os.getpid() != _MAIN:
+      os._exit(1)
+    vars(self).update(state)
+
+def _story(extra=None):
+  story = []
+  for section in range(4):
+    story.append(Paragraph(f'Section {section}', STYLE))
+    if extra is not None and section == 1:
+      story.append(extra())
+    for _ in range(12):
+      story += [Paragraph(TEXT, STYLE), Spacer(1, 6)]
+    story.append(PageBreak())
+  return story[:-1]
+
+def _build(template, story, **kw):
+  output = io.BytesIO()
+  template(output, invariant=1, **kw).build(story)
+  return output.getvalue()
+
+@pytest.fixture
+def pool():
+  with ProcessPoolExecutor(2) as executor:
+    yield executor
+
+def test_parallel_layout_matches_simple_doc_template(pool, monkeypatch):
+  results = []
+  section_result = parallel._section_result
+  monkeypatch.setattr(parallel, '_section_result', lambda future: results.append(section_result(future)) or results[-1])
+  assert _build(ParallelDocTemplate, _story(), pool=pool) == _build(SimpleDocTemplate, _story())
+  # Every section was laid out by a worker
+  assert len(results) == 4 and all(result is not None for result in results)
+
+@pytest.mark.parametrize('extra', [_FailsInWorkers, _KillsWorkers])
+def test_sections_failing_in_workers_are_laid_out_here(extra):
+  expected = _build(SimpleDocTemplate, _story(extra))
+  with ProcessPoolExecutor(2) as executor:
+    assert _build(ParallelDocTemplate, _story(extra), pool=executor) == expected
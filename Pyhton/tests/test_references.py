@@ -0,0 +1,73 @@
+import io
+import pickle
+
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import PageBreak, SimpleDocTemplate
+
+from betik.convert import MarkdownToPDFConverter
+from betik.flowables import EquationLabels, display_flowables
+from betik.references import Label, ReferenceIndex, build_with_references
+from betik.session import EquationSession
+
+STYLE = ParagraphStyle('Body', fontName='Helvetica', fontSize=11, leading=14)
+
+def _equation_story(session, index, stories):
+  # A reference to an equation that comes two pages later
+  def make_story():
+    labels = EquationLabels(index)
+    story = display_flowables(r'See \eqref{e:one} on page \pageref{e:one}.', STYLE, session, labels=labels)
+    story += [PageBreak(), PageBreak()]
+    story += display_flowables(r'Then $$x \label{e:one}$$ and \eqref{e:one} again.', STYLE, session, labels=labels)
+    # The build empties the list
+    stories.append(list(story))
+    return story
+  return make_story
+
+def test_forward_equation_references_resolve_across_builds(fake_tex, tmp_path):
+  session = EquationSession(cache_dir=str(tmp_path / 'cache'))
+  session.converter.format_dir = str(tmp_path / 'formats')
+  path = str(tmp_path / 'references.json')
+
+  stories = []
+  index = ReferenceIndex(path)
+  passes = build_with_references(SimpleDocTemplate(io.BytesIO()), _equation_story(session, index, stories), index)
+
+  assert passes == 2
+  first, last = stories
+  assert first[0].text == 'See (??) on page ??.'
+  assert last[0].text == 'See <a href="#e:one">(1)</a> on page <a href="#e:one">3</a>.'
+  # A reference after the equation has its number in the first pass already
+  assert 'and <a href="#e:one">(1)</a> again.' in first[-1].text
+
+  # The next run starts from the saved index and needs a single pass
+  stories = []
+  index = ReferenceIndex(path)
+  passes = build_with_references(SimpleDocTemplate(io.BytesIO()), _equation_story(session, index, stories), index)
+  assert passes == 1
+  assert stories[0][0].text == last[0].text
+
+def test_markdown_labels_name_their_page():
+  index = ReferenceIndex()
+  html = '<p>Details on page \\pageref{details}.</p><p>x</p><p>The details\\label{details}</p>'
+  stories = []
+
+  def make_story():
+    stories.append(list(MarkdownToPDFConverter(index).iter_elements(html)))
+    return [stories[-1][0], PageBreak()] + stories[-1][1:]
+
+  assert build_with_references(SimpleDocTemplate(io.BytesIO()), make_story, index) == 2
+  assert stories[-1][0].text == 'Details on page <a href="#details">2</a>.'
+  assert any(isinstance(flowable, Label) for flowable in stories[-1])
+
+def test_labels_find_their_index_after_pickling():
+  index = ReferenceIndex()
+  label = pickle.loads(pickle.dumps(Label('fig:one', index)))
+  assert label.index is index
+
+  # Where the index is not known a stand-in goes along, which finds it again
+  data = pickle.dumps(label)
+  token = id(index._token)
+  del index, label
+  stand_in = pickle.loads(data).index
+  assert stand_in.lookup('fig:one') == (None, None)
+  assert pickle.loads(pickle.dumps(stand_in))._token == token
@@ -0,0 +1,48 @@
+import io
+
+from PIL import Image
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+from reportlab.lib.styles import ParagraphStyle
+
+from betik.pdf import EquationCanvas
+from betik.session import EquationSession
+
+STYLE = ParagraphStyle('Body', fontName='Helvetica', fontSize=11, leading=14)
+
+def _latex_runs(fake_tex):
+  # Without the runs building and checking the format
+  return [call for call in fake_tex.calls('latex') if call.endswith('batch.tex')]
+
+def test_vector_sessions_compile_each_batch_once(fake_tex, tmp_path):
+  session = EquationSession(vector=True, cache_dir=str(tmp_path / 'cache'))
+  session.converter.format_dir = session.svg_converter.format_dir = str(tmp_path / 'formats')
+  rendered = session.render_equations([r'\alpha', r'\frac{1}{2}', r'\beta'], inline=True)
+
+  assert all(rendered)
+  assert len(_latex_runs(fake_tex)) == 1
+  assert len(fake_tex.calls('dvipng')) == 1
+  assert len(fake_tex.calls('dvisvgm')) == 1
+  for equation in rendered:
+    assert session.vector_twins[equation.path].endswith('.svg')
+    # The SVG metrics replace the pixel rounded ones
+    assert equation.metrics.depth == 2.1
+
+  # Both formats come from the cache the next time
+  assert all(session.render_equations([r'\alpha'], inline=True))
+  assert len(_latex_runs(fake_tex)) == 1
+
+def test_only_registered_twins_replace_images(tmp_path):
+  image = tmp_path / 'photo.png'
+  Image.new('RGB', (20, 10), 'red').save(image)
+  (tmp_path / 'photo.svg').write_text(
+    '<svg xmlns="http://www.w3.org/2000/svg" width="20pt" height="10pt"><rect width="20" height="10"/></svg>'
+  )
+
+  def build(**kw):
+    output = io.BytesIO()
+    story = [Paragraph(f'<img src="{image}" width="20" height="10"/>', STYLE)]
+    SimpleDocTemplate(output, invariant=1).build(story, canvasmaker=lambda *a, **k: EquationCanvas(*a, **k, **kw))
+    return output.getvalue()
+
+  assert b'/Subtype /Image' in build()
+  assert b'/Subtype /Image' not in build(twins={str(image): str(tmp_path / 'photo.svg')})
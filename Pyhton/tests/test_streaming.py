@@ -0,0 +1,47 @@
+import io
+
+import pytest
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from betik.streaming import StreamingDocTemplate
+
+STYLE = ParagraphStyle('Body', fontName='Helvetica', fontSize=11, leading=14)
+HEADING = ParagraphStyle('Heading', parent=STYLE, fontName='Helvetica-Bold', fontSize=14, leading=18, keepWithNext=1)
+
+TEXT = "Some text with <b>bold words</b> that is long enough to take a few lines of the page. " * 6
+
+def _story(created=None):
+  for chapter in range(16):
+    # Chains of headings kept with the text after them, longer than small
+    # lookaheads, some of them reaching the bottom of a page
+    for level in range(chapter % 4 + 1):
+      yield Paragraph(f'Heading {chapter}.{level}', HEADING)
+    for n in range(3 + chapter % 5):
+      yield Paragraph(TEXT, STYLE)
+      yield Spacer(1, 6)
+      if created is not None:
+        created.append(n)
+
+def _build(template, story, **kw):
+  output = io.BytesIO()
+  template(output, invariant=1, **kw).build(story)
+  return output.getvalue()
+
+@pytest.mark.parametrize('lookahead', [1, 3, 64])
+def test_streaming_matches_simple_doc_template(lookahead):
+  expected = _build(SimpleDocTemplate, list(_story()))
+  assert _build(StreamingDocTemplate, _story(), lookahead=lookahead) == expected
+
+def test_the_story_is_read_as_layout_reaches_it():
+  created = []
+  pages = []
+
+  def on_page(canvas, doc):
+    pages.append(len(created))
+
+  output = io.BytesIO()
+  StreamingDocTemplate(output, invariant=1, lookahead=4).build(_story(created), onLaterPages=on_page)
+  # When the second page starts, only the paragraphs of the first and the lookahead were created
+  assert len(pages) > 4
+  assert pages[0] < len(created) // 4
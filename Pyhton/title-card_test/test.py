@@ -1,26 +1,25 @@
+import os
+import sys
+
 from reportlab.platypus import ListFlowable, ListItem, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ListStyle, ParagraphStyle
 from reportlab.lib.units import cm, inch
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import registerFontFamily
-from reportlab.pdfbase.ttfonts import TTFont
-
-pdfmetrics.registerFont(TTFont('Times', 'times.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBd', 'timesbd.ttf'))
-pdfmetrics.registerFont(TTFont('TimesIt', 'timesi.ttf'))
-pdfmetrics.registerFont(TTFont('TimesBI', 'timesbi.ttf'))
-registerFontFamily('Times', normal='Times', bold='TimesBd', italic='TimesIt', boldItalic='TimesBI')
-
-stiller = {
-  'Paragraf':      ParagraphStyle(name='paragraf', fontName='Times',   fontSize=12, leading=12, firstLineIndent=inch/4, alignment=TA_JUSTIFY, uriWasteReduce=0.3, allowWidows=0),
-  'Metin':         ParagraphStyle(name='metin',    fontName='Times',   fontSize=12, leading=18,                         alignment=TA_LEFT,    uriWasteReduce=0.3, allowWidows=0),
-  'KalinMetin':    ParagraphStyle(name='metin',    fontName='TimesBd', fontSize=12, leading=18,                         alignment=TA_LEFT, uriWasteReduce=0.3, allowWidows=0),
-  'Baslik':        ParagraphStyle(name='baslik',   fontName='TimesBd', fontSize=12, leading=18, leftIndent=inch/4,      alignment=TA_LEFT),
-  'Madde':    ListStyle(name='madde', leftIndent=inch/4, rightIndent=0, bulletAlign='center', bulletType='bullet', bulletColor='black', bulletFontName='Times',   bulletFontSize=12, bulletDedent=inch/8, start='bulletchar'),
-  'Liste':    ListStyle(name='liste', leftIndent=inch/4, rightIndent=0, bulletAlign='right',  bulletType='1',      bulletColor='black', bulletFontName='TimesBd', bulletFontSize=12, bulletDedent=inch/8, bulletFormat='%s.')
-}
+from reportlab.lib.enums import TA_LEFT
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from betik.fonts import register_times
+from betik.styles import report_styles
+
+register_times()
+
+ortak = report_styles()
+# The card keeps its own look: a quarter inch indent, 18pt Metin lines and bold list numbers
+stiller = ortak.extend({
+  'Paragraf': ortak.variant('Paragraf', firstLineIndent=inch/4, autoLeading=''),
+  'Metin':    ortak.variant('Metin', leading=18),
+  'Baslik':   ortak.variant('Baslik', uriWasteReduce=0, allowWidows=1),
+  'Liste':    ortak.variant('Liste', bulletFontName='TimesBd'),
+})
 
 page_width, page_height = A4
 page_margin = 2.5 * cm